@@ -1,8 +1,14 @@
 import random
+import numpy as np
 
 class Grid:
-    def __init__(self, length, width, num_mines):
+    # Name recorded in the game log so that replays rebuild the same kind of board.
+    name = 'list'
+
+    # @params: rng is the random.Random stream of the board and its hints.
+    def __init__(self, length, width, num_mines, rng=None):
         self.board = [[0 for j in range(width)] for i in range(length)]
+        self.rng = rng if rng else random.Random()
         self.length = length
         self.width = width
         self.num_mines = num_mines
@@ -13,13 +19,15 @@ class Grid:
     # Could be called with setBoard(Grid(l, w, n_m).getBoard())
     def setBoard(self, board):
         self.board = board
+        self.mines = [(x, y) for x in range(self.length) for y in range(self.width) if board[x][y] == -1]
+        self.reset_mine_pool()
 
     # Randomly initialize board given l, w, and num_mines
     def initialize_board(self):
         # First put mines on the board
         while len(self.mines) < self.num_mines:
-            x = random.randrange(self.length)
-            y = random.randrange(self.width)
+            x = self.rng.randrange(self.length)
+            y = self.rng.randrange(self.width)
             if (x, y) not in self.mines:
                 self.mines.append((x, y))
             for x, y in self.mines:
@@ -35,11 +43,39 @@ class Grid:
                         if (x, y) in self.mines:
                             num_mines += 1
                             self.board[i][j] = num_mines
+        self.reset_mine_pool()
+
+    # The mines not exposed yet are kept in a list with the index of every mine in it, so
+    # that a mine is removed by swapping in the last one and hints are drawn in O(1).
+    def reset_mine_pool(self):
+        self.unexposed_mines = list(self.mines)
+        self.unexposed_index = {m: i for i, m in enumerate(self.unexposed_mines)}
+
+    # Called by the player when the mine at (x, y) shows up on its board.
+    # Returns the index it had in the pool, for unexposeMine.
+    def exposeMine(self, x, y):
+        i = self.unexposed_index.pop((x, y))
+        last = self.unexposed_mines.pop()
+        if i < len(self.unexposed_mines):
+            self.unexposed_mines[i] = last
+            self.unexposed_index[last] = i
+        return i
+
+    # Undoes exposeMine(x, y), putting the pool back in the exact same order.
+    def unexposeMine(self, x, y, i):
+        if i < len(self.unexposed_mines):
+            moved = self.unexposed_mines[i]
+            self.unexposed_index[moved] = len(self.unexposed_mines)
+            self.unexposed_mines.append(moved)
+            self.unexposed_mines[i] = (x, y)
+        else:
+            self.unexposed_mines.append((x, y))
+        self.unexposed_index[(x, y)] = i
 
     # Returns a random mine that's not exposed to current board yet.
-    def randomMine(self, currentMinesExplored):
-        unexposed_mines = [m for m in self.mines if m not in currentMinesExplored]
-        return random.choice(unexposed_mines)
+    # currentMinesExplored is kept for compatibility - the exposed mines are tracked by exposeMine.
+    def randomMine(self, currentMinesExplored=None):
+        return self.rng.choice(self.unexposed_mines)
 
     # Click / flag on the location (x, y) - returns -1 if clicks on the mine.
     def clickOn(self, x, y):
@@ -47,4 +83,93 @@ class Grid:
 
     # return the current board
     def getBoard(self):
-        return self.board
\ No newline at end of file
+        return self.board
+
+# Same game as Grid, but the board is an int8 numpy array generated in one shot:
+# mine positions are sampled without replacement and the numbers come from a
+# shifted sum over the 3 * 3 neighbourhood, so large boards (up to 1000 * 1000)
+# are cheap to create. getBoard returns the array, which still supports board[x][y].
+class ArrayGrid(Grid):
+    name = 'array'
+
+    # @params: seed of the numpy generator - drawn from rng if not given, so a Player seed
+    # still reproduces the board.
+    def __init__(self, length, width, num_mines, rng=None, seed=None):
+        self.rng = rng if rng else random.Random()
+        self.length = length
+        self.width = width
+        self.num_mines = num_mines
+        self.seed = seed if seed is not None else self.rng.randint(0, 0x0ffffffff)
+        self.initialize_board()
+
+    def setBoard(self, board):
+        self.board = np.asarray(board, dtype=np.int8)
+        self.set_mines(self.board == -1)
+
+    def initialize_board(self):
+        mines = random_mine_mask(np.random.RandomState(self.seed), self.length, self.width, self.num_mines)
+        self.board = neighbour_counts(mines)
+        self.set_mines(mines)
+
+    def set_mines(self, mines):
+        xs, ys = np.nonzero(mines)
+        self.mines = list(zip(xs.tolist(), ys.tolist()))
+        self.reset_mine_pool()
+
+    def clickOn(self, x, y):
+        return int(self.board[x, y])
+
+# Produces many boards of the same layout at once, for trainers and evaluators that need
+# thousands of games per call instead of one Grid per episode.
+# Every board comes with the game seed it was generated from: board i equals the board of
+# Player(length, width, num_mines, seeds[i], ArrayGrid), so any game can be replayed.
+class BoardBatch:
+    # @params: seed makes the whole sequence of batches reproducible.
+    def __init__(self, length, width, num_mines, seed=None):
+        self.length = length
+        self.width = width
+        self.num_mines = num_mines
+        self.rng = random.Random(seed)
+
+    # Returns (boards, seeds): a contiguous (n, length, width) int8 array using the Grid
+    # encoding (-1 for mines), and the list of game seeds. Seeds may be given to rebuild boards.
+    def generate(self, n, seeds=None):
+        if seeds is None:
+            seeds = [self.rng.randint(1, 0x0ffffffff) for _ in range(n)]
+        mines = np.empty((len(seeds), self.length, self.width), dtype=bool)
+        for i, seed in enumerate(seeds):
+            rng = np.random.RandomState(array_grid_seed(seed))
+            mines[i] = random_mine_mask(rng, self.length, self.width, self.num_mines)
+        return neighbour_counts(mines), seeds
+
+# Grid implementations by the name recorded in game logs.
+GRID_CLASSES = {Grid.name: Grid, ArrayGrid.name: ArrayGrid}
+
+# Returns the seed ArrayGrid draws for a game seeded with |seed| by Player.
+def array_grid_seed(seed):
+    return random.Random(seed).randint(0, 0x0ffffffff)
+
+# Returns a length * width boolean array with exactly num_mines cells set, sampled without replacement.
+def random_mine_mask(rng, length, width, num_mines):
+    mines = np.zeros(length * width, dtype=bool)
+    mines[rng.choice(length * width, num_mines, replace=False)] = True
+    return mines.reshape(length, width)
+
+# Returns the board for a boolean mine array of shape (..., length, width): the number of
+# adjacent mines on every cell, and -1 on the mines themselves.
+def neighbour_counts(mines):
+    board = neighbour_sum(mines)
+    board[mines] = -1
+    return board
+
+# Returns, for every cell of a boolean array of shape (..., length, width), the number of
+# set cells in its 3 * 3 neighbourhood (itself included), as int8.
+def neighbour_sum(cells):
+    length, width = cells.shape[-2:]
+    padded = np.zeros(cells.shape[:-2] + (length + 2, width + 2), dtype=np.int8)
+    padded[..., 1:-1, 1:-1] = cells
+    total = np.zeros(cells.shape, dtype=np.int8)
+    for dx in range(3):
+        for dy in range(3):
+            total += padded[..., dx:dx + length, dy:dy + width]
+    return total
@@ -2,27 +2,48 @@
 import random
 from Grid import Grid
 from logger import Logger
+from PlayerBoard import PlayerBoard
+
+# Every game owns its random streams, all derived from the game seed, so that games can run
+# in separate threads and still be replayed from the logged seed: the board and its hints
+# draw from random.Random(seed), the agent from random.Random(stream_seed(seed, AGENT_STREAM)).
+AGENT_STREAM = 1
+
+def stream_seed(seed, stream):
+    return seed + (stream << 32)
+
+# Rewards of the actions (see README.md), as (reward on a mine, reward on a normal tile).
+CLICK_REWARDS = (-10, 2)
+FLAG_REWARDS = (15, -10)
+HINT_REWARD = -3
 
 class Player:
-    def __init__(self, length, width, num_mines, seed=None):
+    # @params: grid_class is the board implementation, Grid or ArrayGrid for large boards.
+    def __init__(self, length, width, num_mines, seed=None, grid_class=Grid):
         # set a random seed and remember it so that games are reproduciable
         self.seed = seed if seed else random.randint(0, 0x0ffffffff)
-        random.seed(self.seed)
-        self.grid = Grid(length, width, num_mines)
+        self.grid = grid_class(length, width, num_mines, random.Random(self.seed))
+        self.rng = random.Random(stream_seed(self.seed, AGENT_STREAM))
         self.length = length
         self.width = width
         self.num_mines = num_mines
-        self.currentPlayerBoard = [["x" for j in range(width)] for i in range(length)]
-        self.currentMines = []
+        self.playerBoard = PlayerBoard(length, width)
+        # int8 array of what the player knows, PlayerBoard.UNKNOWN for unexplored tiles.
+        self.currentPlayerBoard = self.playerBoard.cells
+        self.currentMines = set()
         self.num_moves = 0
         self.score = 0
         self.num_flags_remaining = num_mines # Maximum number of flag option we can call
         self.logger = Logger(self.length, self.width, num_mines, self.seed)
+        if self.grid.name != Grid.name:
+            self.logger.game_config['grid'] = self.grid.name
         # Number of correct moves we have made so far - i.e. click a non-mine tile or flag a mine tile.
         self.correct_moves = 0
         # Number of times where we flag a mine tile.
         self.correct_mines = 0
         self.known_tiles_to_explore = []
+        # Changes to undo on restore(), recorded once snapshot() has been called.
+        self.trail = None
 
     def save(self, agent):
         self.logger.write(agent, self.score)
@@ -38,20 +59,52 @@ class Player:
 
     # For debugging only.
     def printPlayerBoard(self):
-        for l in self.currentPlayerBoard:
-            list_string = [str(i) for i in l]
-            print " ".join(list_string)
+        print self.playerBoard
+
+    # Returns a token for restore(), which rolls back every move made after this call - for
+    # agents that try moves ahead. Only the tiles and counters changed by the moves are recorded,
+    # so restoring costs O(changed tiles). Hints drawn meanwhile also rewind the stream of the board.
+    def snapshot(self):
+        if self.trail is None:
+            self.trail = []
+        return (len(self.trail), self.score, self.num_moves, self.correct_moves, self.correct_mines,
+                self.num_flags_remaining, len(self.logger.actions))
+
+    def restore(self, token):
+        depth, self.score, self.num_moves, self.correct_moves, self.correct_mines, \
+            self.num_flags_remaining, num_actions = token
+        while len(self.trail) > depth:
+            revealed, mine_index, rng_state = self.trail.pop()
+            if rng_state is not None:
+                self.grid.rng.setstate(rng_state)
+            self.playerBoard.hide(revealed)
+            if mine_index is not None:
+                x, y = revealed[0], revealed[1]
+                self.currentMines.remove((x, y))
+                self.grid.unexposeMine(x, y, mine_index)
+        del self.logger.actions[num_actions:]
+
+    # Shows value on (x, y) of the player board, and keeps track of the mines found.
+    # rng_state is the state of the board stream before a hint was drawn.
+    def revealTile(self, x, y, value, rng_state=None):
+        revealed = self.playerBoard.reveal(x, y, value)
+        mine_index = None
+        if value == -1:
+            self.currentMines.add((x, y))
+            mine_index = self.grid.exposeMine(x, y)
+        if self.trail is not None:
+            self.trail.append((revealed, mine_index, rng_state))
 
     # general function to calculate reward on x, y
     def reward(self, x, y, reward_for_mine, reward_for_normal):
         # Already explored.
-        if str(self.currentPlayerBoard[x][y]) != "x":
+        if not self.playerBoard.isUnknown(x, y):
             return -float("inf")
-        self.currentPlayerBoard[x][y] = self.grid.clickOn(x, y)
+        value = self.grid.clickOn(x, y)
+        self.revealTile(x, y, value)
         self.num_moves += 1
-        if self.currentPlayerBoard[x][y] == -1:
+        if value == -1:
             self.score += reward_for_mine
-            self.currentMines.append((x, y))
             if reward_for_mine > 0:
                 self.correct_moves += 1
                 self.correct_mines += 1
@@ -64,7 +117,7 @@ class Player:
     # Returns value: reward in this action.
     def click(self, x, y):
         self.logger.log('click', x, y)
-        return self.reward(x, y, -10, 2)
+        return self.reward(x, y, *CLICK_REWARDS)
 
     # Returns value: reward in this action.
     def flag(self, x, y):
@@ -73,20 +126,27 @@ class Player:
             return -float("inf")
         self.num_flags_remaining -= 1
         self.logger.log('flag', x, y)
-        return self.reward(x, y, 15, -10)
+        return self.reward(x, y, *FLAG_REWARDS)
 
     # Returns value: location of a random mine, reward in this action (-10)
-    def hint(self):
+    # @params: mine: the location to reveal instead of a random one, to replay a logged hint.
+    def hint(self, mine=None):
         # No more mines to hint.
         if len(self.currentMines) == self.num_mines:
             return None, -float("inf")
-        x, y = self.grid.randomMine(self.currentMines)
-        self.currentPlayerBoard[x][y] = -1
-        self.currentMines.append((x, y))
+        if mine is not None:
+            if mine not in self.grid.unexposed_index:
+                raise ValueError("No unexposed mine at %s" % str(mine))
+            x, y = mine
+            rng_state = None
+        else:
+            rng_state = self.grid.rng.getstate() if self.trail is not None else None
+            x, y = self.grid.randomMine(self.currentMines)
+        self.revealTile(x, y, -1, rng_state)
         self.num_moves += 1
-        self.score -= 3
+        self.score += HINT_REWARD
         self.logger.log('hint', x, y)
-        return ((x, y), -3)
+        return ((x, y), HINT_REWARD)
 
     def gameEnds(self):
         return self.num_moves == self.length * self.width
@@ -111,36 +171,33 @@ class AIPlayer(Player):
     def chooseFromBasicRules(self, last_x, last_y):
         # First, we define some simple rules based on the last action and the board.
         if last_x != None:
-            # a list of positions that are neighbors of last action location and itself. At most 9.
-            list_surrounding_tiles = [(x1, y1) for x1 in range(last_x - 1, last_x + 2) if x1 >= 0 and x1 < self.length for y1 in range(last_y - 1, last_y + 2) if y1 >= 0 and y1 < self.width]
-            # A list of unknown tiles around last action location. At most 8.
-            list_surrounding_unknown_tiles = [p for p in list_surrounding_tiles if self.currentPlayerBoard[p[0]][p[1]] == "x"]
-            list_surrounding_mines = [p for p in list_surrounding_tiles if self.currentPlayerBoard[p[0]][p[1]] == -1]
+            board = self.playerBoard
+            # Number of mines around the last action location we haven't found yet, and number of unknown tiles around it. At most 8.
+            num_missing_mines = self.currentPlayerBoard[last_x][last_y] - board.mine_neighbours[last_x, last_y]
+            num_surrounding_unknown_tiles = board.unknown_neighbours[last_x, last_y]
             # 1. if we have already found all the mines around the tile, we should click on all the adjacent tiles.
-            if self.currentPlayerBoard[last_x][last_y] - len(list_surrounding_mines) == 0:
-                for x, y in list_surrounding_unknown_tiles:
+            if num_missing_mines == 0:
+                for x, y in board.unknownNeighbours(last_x, last_y):
                     if ("click", x, y) not in self.known_tiles_to_explore:
                         self.known_tiles_to_explore.append(("click", x, y))
             # 2. if the tile shows N + M, we have found M mines around the tile, and there are N tiles unknown arround the last tile, they should all be mines.
-            elif self.currentPlayerBoard[last_x][last_y] - len(list_surrounding_mines) == len(list_surrounding_unknown_tiles):
-                for x, y in list_surrounding_unknown_tiles:
+            elif num_missing_mines == num_surrounding_unknown_tiles:
+                for x, y in board.unknownNeighbours(last_x, last_y):
                     if ("flag", x, y) not in self.known_tiles_to_explore:
                         self.known_tiles_to_explore.append(("flag", x, y))
             num_remaining_tiles = self.length * self.width - self.num_moves
             num_remaining_mines = self.num_mines - len(self.currentMines)
             # 3. if we have N tiles remaining and no more mines, the rest should all be click.
             if num_remaining_mines == 0:
-                for x in range(self.length):
-                    for y in range(self.width):
-                        if self.currentPlayerBoard[x][y] == "x" and ("click", x, y) not in self.known_tiles_to_explore:
-                            self.known_tiles_to_explore.append(("click", x, y))
+                for x, y in board.unknownCells():
+                    if ("click", x, y) not in self.known_tiles_to_explore:
+                        self.known_tiles_to_explore.append(("click", x, y))
 
             # 4. if we have N tiles remaining and N mines, the rest should all be flag.
             if num_remaining_mines == num_remaining_tiles:
-                for x in range(self.length):
-                    for y in range(self.width):
-                        if self.currentPlayerBoard[x][y] == "x" and ("flag", x, y) not in self.known_tiles_to_explore:
-                            self.known_tiles_to_explore.append(("flag", x, y))
+                for x, y in board.unknownCells():
+                    if ("flag", x, y) not in self.known_tiles_to_explore:
+                        self.known_tiles_to_explore.append(("flag", x, y))
 
         # If we know some tiles for sure, we will return that action and remove it from known tiles.
         if self.num_flags_remaining == 0:
@@ -163,11 +220,11 @@ class AIPlayer(Player):
         if numRemainingCells == 0:
             return "quit", []
         # Find a cell that we don't know yet.
-        randomCell = (random.choice(range(self.length)), random.choice(range(self.width)))
-        while self.currentPlayerBoard[randomCell[0]][randomCell[1]] != "x":
-            randomCell = (random.choice(range(self.length)), random.choice(range(self.width)))
+        randomCell = (self.rng.choice(range(self.length)), self.rng.choice(range(self.width)))
+        while not self.playerBoard.isUnknown(randomCell[0], randomCell[1]):
+            randomCell = (self.rng.choice(range(self.length)), self.rng.choice(range(self.width)))
         chance_flag = float(numRemainingMines) / numRemainingCells
-        if random.random() < chance_flag and self.num_flags_remaining > 0:
+        if self.rng.random() < chance_flag and self.num_flags_remaining > 0:
             return "flag", randomCell[0], randomCell[1]
         return "click", randomCell[0], randomCell[1]
 
@@ -0,0 +1,85 @@
+import numpy as np
+from Grid import neighbour_sum
+
+# Value of a cell the player hasn't explored yet. Explored cells hold the value of the Grid:
+# -1 for a mine, 0 - 8 for the number of mines around.
+UNKNOWN = -2
+
+# The board as seen by the player, as an int8 array, with counters updated on every reveal so
+# that agents can read the neighbourhood of a cell without scanning it:
+#   mine_neighbours[x][y]: number of known mines around (x, y)
+#   unknown_neighbours[x][y]: number of unknown tiles around (x, y)
+#   num_unknown: number of unknown tiles on the whole board
+#   frontier: set of unknown tiles next to a revealed number - the ones the numbers say
+#       something about. The other unknown tiles are the interior; it can be as large as the
+#       board, so it is only kept as the complement (see isInterior / interiorCells).
+class PlayerBoard:
+    def __init__(self, length, width):
+        self.length = length
+        self.width = width
+        self.cells = np.full((length, width), UNKNOWN, dtype=np.int8)
+        self.mine_neighbours = np.zeros((length, width), dtype=np.int8)
+        self.unknown_neighbours = neighbour_sum(np.ones((length, width), dtype=bool)) - 1
+        self.num_unknown = length * width
+        self.frontier = set()
+
+    def __str__(self):
+        return "\n".join(" ".join("x" if v == UNKNOWN else str(v) for v in row) for row in self.cells.tolist())
+
+    def isUnknown(self, x, y):
+        return self.cells[x, y] == UNKNOWN
+
+    def isInterior(self, x, y):
+        return self.cells[x, y] == UNKNOWN and (x, y) not in self.frontier
+
+    def numInterior(self):
+        return self.num_unknown - len(self.frontier)
+
+    # Returns all unknown positions not on the frontier, row by row.
+    def interiorCells(self):
+        return [p for p in self.unknownCells() if p not in self.frontier]
+
+    # Sets the value of the unknown tile (x, y) and updates the counters of its neighbours.
+    # Returns what hide() needs to undo it.
+    def reveal(self, x, y, value):
+        self.cells[x, y] = value
+        self.num_unknown -= 1
+        x0, x1, y0, y1 = max(x - 1, 0), x + 2, max(y - 1, 0), y + 2
+        self.unknown_neighbours[x0:x1, y0:y1] -= 1
+        self.unknown_neighbours[x, y] += 1
+        if value == -1:
+            self.mine_neighbours[x0:x1, y0:y1] += 1
+            self.mine_neighbours[x, y] -= 1
+        was_frontier = (x, y) in self.frontier
+        self.frontier.discard((x, y))
+        added = []
+        if value >= 0 and self.unknown_neighbours[x, y] > 0:
+            added = [p for p in self.unknownNeighbours(x, y) if p not in self.frontier]
+            self.frontier.update(added)
+        return x, y, value, was_frontier, added
+
+    # Makes a revealed tile unknown again, given the return value of reveal().
+    def hide(self, revealed):
+        x, y, value, was_frontier, added = revealed
+        self.cells[x, y] = UNKNOWN
+        self.num_unknown += 1
+        x0, x1, y0, y1 = max(x - 1, 0), x + 2, max(y - 1, 0), y + 2
+        self.unknown_neighbours[x0:x1, y0:y1] += 1
+        self.unknown_neighbours[x, y] -= 1
+        if value == -1:
+            self.mine_neighbours[x0:x1, y0:y1] -= 1
+            self.mine_neighbours[x, y] += 1
+        self.frontier.difference_update(added)
+        if was_frontier:
+            self.frontier.add((x, y))
+
+    # Returns the positions around (x, y), at most 8.
+    def neighbours(self, x, y):
+        return [(x1, y1) for x1 in range(max(x - 1, 0), min(x + 2, self.length)) for y1 in range(max(y - 1, 0), min(y + 2, self.width)) if (x1, y1) != (x, y)]
+
+    def unknownNeighbours(self, x, y):
+        return [p for p in self.neighbours(x, y) if self.cells[p] == UNKNOWN]
+
+    # Returns all unknown positions, row by row.
+    def unknownCells(self):
+        return [tuple(p) for p in np.argwhere(self.cells == UNKNOWN).tolist()]
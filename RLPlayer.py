@@ -7,8 +7,10 @@ from Player import AIPlayer
 # discount: a number between 0 and 1, which determines the discount factor
 # featureExtractor: a function that takes a state and action and returns a list of (feature name, feature value) pairs.
 # explorationProb: the epsilon value indicating how frequently the policy returns a random action
+# rng: the random.Random stream of the policy.
 class QLearningAlgorithm:
-    def __init__(self, actions, discount, featureExtractor, explorationProb=0.95):
+    def __init__(self, actions, discount, featureExtractor, explorationProb=0.95, rng=None):
+        self.rng = rng if rng else random.Random()
         self.actions = actions
         self.discount = discount
         self.featureExtractor = featureExtractor
@@ -28,8 +30,8 @@ class QLearningAlgorithm:
     # |explorationProb|, take a random action.
     def getAction(self, state, verbose=0):
         self.numIters += 1
-        if random.random() < self.explorationProb:
-            return random.choice(self.actions(state))
+        if self.rng.random() < self.explorationProb:
+            return self.rng.choice(self.actions(state))
         else:
             l = [(self.getQ(state, action), action) for action in self.actions(state)]
             if verbose:
@@ -43,14 +45,14 @@ class QLearningAlgorithm:
             click_choices = [i for i in l if i[0] == max_weight and i[1][0] == "click"]
             flag_choices = [i for i in l if i[0] == max_weight and i[1][0] == "flag"]
             if len(click_choices) == 0:
-                return random.choice(flag_choices)[1]
+                return self.rng.choice(flag_choices)[1]
             elif len(flag_choices) == 0:
-                return random.choice(click_choices)[1]
+                return self.rng.choice(click_choices)[1]
             numRemainingMines = state.num_mines - len(state.currentMines)
             numRemainingCells = state.length * state.width - state.num_moves
-            if random.random() < float(numRemainingMines) / numRemainingCells:
-                return random.choice(flag_choices)[1]
-            return random.choice(click_choices)[1]
+            if self.rng.random() < float(numRemainingMines) / numRemainingCells:
+                return self.rng.choice(flag_choices)[1]
+            return self.rng.choice(click_choices)[1]
 
     # Call this function to get the step size to update the weights.
     def getStepSize(self):
@@ -73,7 +75,7 @@ class QLearningAlgorithm:
 # Does not perform well at all.
 def identityFeatureExtractor(state, action):
     # First serialize state to a string, so that it's hashable:
-    string_state = ''.join([''.join(str(e) for e in i) for i in state.currentPlayerBoard])
+    string_state = state.currentPlayerBoard.tostring()
     featureKey = (string_state, action)
     featureValue = 1
     return [(featureKey, featureValue)]
@@ -90,20 +92,19 @@ def ImprovedFeatureExtractor(state, action):
     list_surrounding_tiles = [(x1, y1) for x1 in range(action[1] - 1, action[1] + 2) if x1 >= 0 and x1 < state.length for y1 in range(action[2] - 1, action[2] + 2) if y1 >= 0 and y1 < state.width]
     list_surrounding_tiles.remove((action[1], action[2]))
     max_neighbor_tile, num_max_neighbor_tile = -1, 0
-    num_surrounding_mines, num_unknown_tile = 0, 0
     target_x, target_y = action[1], action[2]
+    # Mines and unknown tiles around the action cell are counted by the player board.
+    num_surrounding_mines = state.playerBoard.mine_neighbours[target_x, target_y]
+    num_unknown_tile = state.playerBoard.unknown_neighbours[target_x, target_y]
     for x, y in list_surrounding_tiles:
-        if state.currentPlayerBoard[x][y] != "x" and state.currentPlayerBoard[x][y] >= 0:
-            if state.currentPlayerBoard[x][y] > max_neighbor_tile:
-                max_neighbor_tile, num_max_neighbor_tile = state.currentPlayerBoard[x][y], 1
-            elif state.currentPlayerBoard[x][y] == max_neighbor_tile:
+        value = state.currentPlayerBoard[x][y]
+        if value >= 0:
+            if value > max_neighbor_tile:
+                max_neighbor_tile, num_max_neighbor_tile = value, 1
+            elif value == max_neighbor_tile:
                 num_max_neighbor_tile += 1
-            feature_key = "Surrounding number(" + str(target_x) + "," + str(target_y) + "): " + str(state.currentPlayerBoard[x][y]) + ";action:" + action[0]
+            feature_key = "Surrounding number(" + str(target_x) + "," + str(target_y) + "): " + str(value) + ";action:" + action[0]
             feature_value_list[feature_key] += 1
-        elif state.currentPlayerBoard[x][y] == "x":
-            num_unknown_tile += 1
-        elif state.currentPlayerBoard[x][y] != "x" and state.currentPlayerBoard[x][y] < 0:
-            num_surrounding_mines += 1
     if num_max_neighbor_tile > 0:
         feature_key = "Maximum Surrounding Neighbor(" + str(target_x) + "," + str(target_y) + "): " + str(max_neighbor_tile) + ";action:" + action[0]
         feature_value_list[feature_key] = 1
@@ -124,25 +125,25 @@ def ImprovedFeatureExtractor(state, action):
     return feature_value_list.items()
 
 # State is the current player.
+# rng: the random.Random stream the seeds of the games are drawn from.
 class MiningMDP:
-    def __init__(self, length, width, num_mines):
+    def __init__(self, length, width, num_mines, rng=None):
         self.length = length
         self.width = width
         self.num_mines = num_mines
+        self.rng = rng if rng else random.Random()
 
     # Each time we start a new state, we will create a new game.
     def startState(self):
-        self.player = AIPlayer(self.length, self.width, self.num_mines)
+        self.player = AIPlayer(self.length, self.width, self.num_mines, self.rng.randint(1, 0x0ffffffff))
         return self.player
 
     def actions(self, state):
         result = []
-        for x in range(state.length):
-            for y in range(state.width):
-                if state.currentPlayerBoard[x][y] == "x":
-                    result.append(("click", x, y))
-                    if state.num_flags_remaining > 0:
-                        result.append(("flag", x, y))
+        for x, y in state.playerBoard.unknownCells():
+            result.append(("click", x, y))
+            if state.num_flags_remaining > 0:
+                result.append(("flag", x, y))
         return result
 
     # Unlike homework, this will only have a deterministic successor.
@@ -175,8 +176,8 @@ def simulate(mdp, rl, numTrials):
 class RLPlayer(AIPlayer):
     def run(self, num_times, with_baseline=False, episodes=10000, save_log=True):
         # It will first train itself.
-        mdp = MiningMDP(self.length, self.width, self.num_mines)
-        rl = QLearningAlgorithm(mdp.actions, mdp.discount(), ImprovedFeatureExtractor)
+        mdp = MiningMDP(self.length, self.width, self.num_mines, self.rng)
+        rl = QLearningAlgorithm(mdp.actions, mdp.discount(), ImprovedFeatureExtractor, rng=self.rng)
         simulate(mdp, rl, numTrials=episodes)
         # Some printing, to know if the weight makes sense.
         weights = defaultdict(list)
@@ -202,11 +203,11 @@ class RLPlayer(AIPlayer):
         score = 0.0
         correct_moves = 0.0
         correct_mines = 0.0
-        random_game_idx = random.randint(0, num_times-1)
+        random_game_idx = self.rng.randint(0, num_times-1)
         games = []
         for idx in range(num_times):
             # A new game
-            player = AIPlayer(self.length, self.width, self.num_mines)
+            player = AIPlayer(self.length, self.width, self.num_mines, self.rng.randint(1, 0x0ffffffff))
             last_action = None
             # print "NEW GAME"
             while not player.gameEnds():
@@ -0,0 +1,79 @@
+import os
+import sqlite3
+
+CATALOG_NAME = "catalog.db"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    file TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    agent TEXT NOT NULL,
+    timestamp INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    width INTEGER NOT NULL,
+    num_mines INTEGER NOT NULL,
+    seed INTEGER NOT NULL,
+    score INTEGER NOT NULL,
+    num_actions INTEGER NOT NULL,
+    PRIMARY KEY (file, position)
+);
+CREATE INDEX IF NOT EXISTS games_by_config ON games (agent, length, width, num_mines, timestamp);
+CREATE INDEX IF NOT EXISTS games_by_seed ON games (seed);
+CREATE INDEX IF NOT EXISTS games_by_score ON games (score);
+"""
+
+# SQLite index of the game logs of a directory, to answer aggregate queries (e.g. the mean
+# score of an agent on a board) without opening the logs. A game is identified by the name of
+# its log file in the directory and its position (byte offset) in that file.
+# Logger adds the games it writes; logger.ingest_logs adds existing logs.
+class Catalog:
+    def __init__(self, log_dir):
+        self.log_dir = log_dir
+        if not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+        self.connection = sqlite3.connect(os.path.join(log_dir, CATALOG_NAME))
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    # @params: games: list of (file, position, game), where game is a dictionary as returned by
+    # logger.read_log, with 'num_actions' in place of 'actions'.
+    # replaced_files: names of log files whose games are removed, in the same transaction, e.g.
+    # because games holds them from another copy of the logs.
+    def add(self, games, replaced_files=()):
+        rows = [(os.path.basename(file), position, game['agent'], game['timestamp'], game['config']['length'],
+                 game['config']['width'], game['config']['num_mines'], game['config']['seed'], game['final_score'],
+                 game['num_actions']) for file, position, game in games]
+        with self.connection:
+            self.connection.executemany("DELETE FROM games WHERE file = ?", [(f,) for f in replaced_files])
+            self.connection.executemany("INSERT OR REPLACE INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    # Returns the names of the log files with at least one game in the catalog.
+    def files(self):
+        return set(row[0] for row in self.connection.execute("SELECT DISTINCT file FROM games"))
+
+    # Returns the number of games of the log file |name| in the catalog.
+    def count(self, name):
+        return self.connection.execute("SELECT COUNT(*) FROM games WHERE file = ?", (name,)).fetchone()[0]
+
+    def clear(self):
+        with self.connection:
+            self.connection.execute("DELETE FROM games")
+
+    # Returns a list of (agent, length, width, num_mines, number of games, mean score, min score,
+    # max score), one per agent and board, for the games matching the given filters.
+    # since is a unix time.
+    def summary(self, agent=None, length=None, width=None, num_mines=None, since=None):
+        conditions, params = [], []
+        for column, value in [("agent", agent), ("length", length), ("width", width), ("num_mines", num_mines)]:
+            if value is not None:
+                conditions.append(column + " = ?")
+                params.append(value)
+        if since is not None:
+            conditions.append("timestamp >= ?")
+            params.append(since)
+        query = "SELECT agent, length, width, num_mines, COUNT(*), AVG(score), MIN(score), MAX(score) FROM games"
+        if conditions:
+            query += " WHERE " + " AND ".join(conditions)
+        query += " GROUP BY agent, length, width, num_mines ORDER BY agent, length, width, num_mines"
+        return self.connection.execute(query, params).fetchall()
@@ -18,19 +18,14 @@ class NNPlayerMDP(MiningMDP):
     def updateBoardState(self, player=None):
         if not player:
             player = self.player
-        boardState = np.zeros((1, self.width, self.length, 11), dtype=np.float32)
-        for y in range(self.length):
-            for x in range(self.width):
-                # discovered mine
-                if player.currentPlayerBoard[x][y] == '-1':
-                    boardState[0][x][y][9] = 1
-                # undiscovered tile
-                elif player.currentPlayerBoard[x][y] == 'x':
-                    boardState[0][x][y][10] = 1
-                # discovered numbered tile
-                else:
-                    boardState[0][x][y][int(player.currentPlayerBoard[x][y])] = 1
-        return boardState
+        return oneHotBoardState(player.currentPlayerBoard)[np.newaxis]
+
+# One hot channels of an int8 player board, as described in NNPlayerMDP.startBoardState.
+# The checkpoints under ckpt/ were trained with discovered mines in the undiscovered
+# channel (10), so channel 9 is kept empty to stay compatible with them.
+def oneHotBoardState(cells):
+    channels = np.where(cells < 0, 10, cells)
+    return np.eye(11, dtype=np.float32)[channels]
 
 class NNPlayer(AIPlayer):
     def _create_placeholders(self, n_h0, n_w0, n_c0, n_y):
@@ -93,7 +88,7 @@ class NNPlayer(AIPlayer):
 
     def run(self, episodes=2000, save_log=True):
         explorationProb = 0.3
-        mdp = NNPlayerMDP(self.length, self.width, self.num_mines)
+        mdp = NNPlayerMDP(self.length, self.width, self.num_mines, self.rng)
         discount = mdp.discount()
         X, Y = self._create_placeholders(self.length, self.width, 11, self.length*self.width*2)
         parameters = self._initialize_parameters()
@@ -142,8 +137,8 @@ class NNPlayer(AIPlayer):
                             X: boardState
                         }).flatten()
                         _, nextAction, index = self.getActionFromNNOutput(mdp, state, allQ)
-                        if random.random() < explorationProb:
-                            nextAction = random.choice(mdp.actions(state))
+                        if self.rng.random() < explorationProb:
+                            nextAction = self.rng.choice(mdp.actions(state))
                             index = self.actionToQIndex(nextAction)
                         # run the action through mdp to get new state and reward
                         newState, reward = mdp.succAndProbReward(state, nextAction)
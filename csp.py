@@ -1,12 +1,92 @@
-import collections, util, copy
+import collections, util, time, binascii
+import multiprocessing
+from fractions import Fraction
 import random
 from Player import AIPlayer
+from pattern_cache import PatternCache
+from deduction import deduce
+import sat
+import transfer
+
+# Solutions of a CSP packed in a byte array, each one as the value indexes of some of its
+# variables in a fixed number of bits: the memory taken is a few bytes per solution instead of a
+# dictionary. Reads like a list of {variable: value} dictionaries.
+class PackedSolutions:
+    def __init__(self, compiled, variables):
+        self.compiled = compiled
+        self.variables = [compiled.index[var] for var in variables]
+        # Bits of the value index of each variable, and bytes of a solution.
+        self.bits = [max(1, (len(compiled.values[var]) - 1).bit_length()) for var in self.variables]
+        self.numBytes = max(1, (sum(self.bits) + 7) // 8)
+        self.data = bytearray()
+        self.count = 0
+
+    # Adds a solution, as a dictionary from variable index to value index.
+    def append(self, assignment):
+        packed, shift = 0, 0
+        for var, bits in zip(self.variables, self.bits):
+            packed |= assignment[var] << shift
+            shift += bits
+        self.data += binascii.unhexlify('%0*x' % (2 * self.numBytes, packed))
+        self.count += 1
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in xrange(*i.indices(self.count))]
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(i)
+        packed = int(binascii.hexlify(self.data[i * self.numBytes:(i + 1) * self.numBytes]), 16)
+        assignment = {}
+        for var, bits in zip(self.variables, self.bits):
+            assignment[self.compiled.variables[var]] = self.compiled.values[var][packed & ((1 << bits) - 1)]
+            packed >>= bits
+        return assignment
+
+    def __iter__(self):
+        for i in xrange(self.count):
+            yield self[i]
+
+# Searches one subtree of BacktrackingSearch.solve_subtrees, in a process of the pool.
+# @params: task is (csp, subproblem, options), see solve_subtrees
+def solve_subtree(task):
+    csp, subproblem, (mcv, ac3, keepAssignments, tallyBySum, seconds, nodes, keepVariables) = task
+    search = BacktrackingSearch()
+    # The subtrees are part of the solve of the parent process.
+    search.profiler = None
+    search.solve(csp, [], mcv, ac3, keepAssignments, tallyBySum, seconds, nodes, keepVariables,
+                 subproblems=[subproblem])
+    result = {name: getattr(search, name) for name in (
+        'numAssignments', 'numOperations', 'numPrunedValues', 'numDeadEnds', 'numRevisions', 'searchedFraction',
+        'complete', 'firstAssignmentNumOperations', 'valueCounts', 'numOptimalAssignments', 'optimalWeight',
+        'optimalAssignment')}
+    result['valueCountsBySum'] = dict(search.valueCountsBySum)
+    result['numAssignmentsBySum'] = dict(search.numAssignmentsBySum)
+    result['solutions'] = bytes(search.solutions.data)
+    result['numSolutions'] = len(search.solutions)
+    return result
+
+# One pool of processes for solve_subtrees per number of processes, kept for the whole run.
+solver_pools = {}
+
+def solver_pool(processes):
+    if processes not in solver_pools:
+        solver_pools[processes] = multiprocessing.Pool(processes)
+    return solver_pools[processes]
 
 # A backtracking algorithm that solves weighted CSP.
 # Usage:
 #   search = BacktrackingSearch()
 #   search.solve(csp)
 class BacktrackingSearch():
+    # Whether solve() prints its statistics, and the profiling.Profiler recording the metrics of
+    # every solve, if any.
+    verbose = False
+    profiler = None
 
     def reset_results(self):
         """
@@ -27,6 +107,21 @@ class BacktrackingSearch():
         # Keep track of the number of times backtrack() gets called.
         self.numOperations = 0
 
+        # Keep track of the number of values removed from domains by arc
+        # consistency, and of the branches it cut because a domain became empty
+        # or a sum unreachable.
+        self.numPrunedValues = 0
+        self.numDeadEnds = 0
+        # Number of revisions of a binary factor or check of a cardinality constraint
+        # by arc consistency.
+        self.numRevisions = 0
+
+        # Whether the whole search space was explored within the budget, and the
+        # part of it that was (1.0 when complete). When the budget runs out, the
+        # other statistics only cover the solutions found so far.
+        self.complete = True
+        self.searchedFraction = 0.0
+
         # Keep track of the number of operations to get to the very first successful
         # assignment (doesn't have to be optimal).
         self.firstAssignmentNumOperations = 0
@@ -34,6 +129,11 @@ class BacktrackingSearch():
         # List of all solutions found.
         self.allAssignments = []
 
+        # Number of solutions and occurrences of each (var, val), by sum of the
+        # values of the solution, when solving with tallyBySum.
+        self.numAssignmentsBySum = collections.defaultdict(int)
+        self.max_assignment_by_sum = collections.defaultdict(lambda: collections.defaultdict(int))
+
 
     def print_stats(self):
         """
@@ -45,145 +145,402 @@ class BacktrackingSearch():
             print "First assignment took %d operations" % self.firstAssignmentNumOperations
         else:
             print "No solution was found."
+        if not self.complete:
+            print "Ran out of budget after searching %f of the assignments" % self.searchedFraction
+        if self.ac3:
+            print "Arc consistency pruned %d values and cut %d branches" % (self.numPrunedValues, self.numDeadEnds)
 
     def get_delta_weight(self, assignment, var, val):
         """
         Given a CSP, a partial assignment, and a proposed new value for a variable,
         return the change of weights after assigning the variable with the proposed
-        value.
+        value. Variables and values are their indexes in the compiled CSP.
 
         @param assignment: A dictionary of current assignment. Unassigned variables
-            do not have entries, while an assigned variable has the assigned value
-            as value in dictionary. e.g. if the domain of the variable A is [5,6],
-            and 6 was assigned to it, then assignment[A] == 6.
-        @param var: name of an unassigned variable.
-        @param val: the proposed value.
+            do not have entries, while an assigned variable has the index of the
+            assigned value as value in dictionary. e.g. if the domain of the
+            variable A is [5,6], and 6 was assigned to it, then assignment[A] == 1.
+        @param var: index of an unassigned variable.
+        @param val: index of the proposed value.
 
         @return w: Change in weights as a result of the proposed assignment. This
             will be used as a multiplier on the current weight.
         """
         assert var not in assignment
         w = 1.0
-        if self.csp.unaryFactors[var]:
-            w *= self.csp.unaryFactors[var][val]
+        unary = self.compiled.unaryWeights[var]
+        if unary:
+            w *= unary[val]
             if w == 0: return w
-        for var2, factor in self.csp.binaryFactors[var].iteritems():
+        for var2, weights, supports in self.compiled.neighbors[var]:
             if var2 not in assignment: continue  # Not assigned yet
-            w *= factor[val][assignment[var2]]
-            if w == 0: return w
+            val2 = assignment[var2]
+            if not supports[val] >> val2 & 1: return 0
+            w *= weights[val][val2]
+        # The sum of every cardinality constraint of var must stay reachable.
+        values = self.compiled.values[var]
+        domain = [values[a] for a in self.domains[var]]
+        value = values[val]
+        for c in self.compiled.cardinalityConstraintsOf[var]:
+            k = self.compiled.cardinalityConstraints[c][1]
+            if self.sumLow[c] - min(domain) + value > k or self.sumHigh[c] - max(domain) + value < k:
+                return 0
         return w
 
-    def solve(self, csp, changed_var_list, mcv = False, ac3 = False):
+    def init_sum_bounds(self):
+        """
+        Computes the lower and upper bounds of the sum of every cardinality
+        constraint, from the current domains: sumLow[c] (sumHigh[c]) is the sum
+        of the smallest (largest) value left in the domain of each variable.
+        Assigned variables have a single value left, so the bounds are updated
+        incrementally by set_domain.
+        """
+        self.sumLow = []
+        self.sumHigh = []
+        # Largest difference between two values of a variable of the constraint,
+        # the bounds can only prune values when they are closer than that to k.
+        self.sumSpread = []
+        values = self.compiled.values
+        for variables, k in self.compiled.cardinalityConstraints:
+            self.sumLow.append(sum(min(values[var]) for var in variables))
+            self.sumHigh.append(sum(max(values[var]) for var in variables))
+            self.sumSpread.append(max(max(values[var]) - min(values[var]) for var in variables))
+
+    def set_domain(self, var, domain, record=True):
+        """
+        Replaces the domain of |var| (always by a new list, so that loops over the
+        previous one are not affected) and updates the bounds of its cardinality
+        constraints. An empty domain counts as [0] in the bounds. The previous
+        domain is pushed on the trail, unless |record| is False.
+        """
+        old = self.domains[var]
+        if record:
+            self.trail.append((var, old))
+        self.domains[var] = domain
+        if self.compiled.cardinalityConstraintsOf[var]:
+            values = self.compiled.values[var]
+            new, old = [values[a] for a in domain], [values[a] for a in old]
+            dLow = (min(new) if new else 0) - (min(old) if old else 0)
+            dHigh = (max(new) if new else 0) - (max(old) if old else 0)
+            for c in self.compiled.cardinalityConstraintsOf[var]:
+                self.sumLow[c] += dLow
+                self.sumHigh[c] += dHigh
+
+    def undo_domains(self, mark):
+        """
+        Restores the domains changed since the trail had length |mark|, in the
+        reverse order of the changes. Undoing costs one step per change, instead
+        of copying every domain at every node.
+        """
+        while len(self.trail) > mark:
+            var, domain = self.trail.pop()
+            self.set_domain(var, domain, record=False)
+
+    def solve(self, csp, changed_var_list, mcv = False, ac3 = False, keepAssignments = True, tallyBySum = False,
+              maxSeconds = None, maxNodes = None, keepVariables = None, processes = None, splitDepth = 4,
+              subproblems = None):
+        """
+        Finds all the solutions of |csp|. With |keepAssignments| they are kept in
+        allAssignments, packed (see PackedSolutions), with the values of the
+        variables |keepVariables| only if given (e.g. to drop auxiliary variables).
+        Without it the solver only counts: allAssignments stays empty, memory
+        doesn't grow with the number of solutions, and optimalAssignment is the
+        first solution of the optimal weight. With |tallyBySum| they
+        are also counted by sum of their values, in numAssignmentsBySum and
+        max_assignment_by_sum. The search stops after |maxSeconds| seconds or
+        |maxNodes| calls of backtrack, if given; see complete.
+
+        With |processes| > 1, the search tree is split after the first |splitDepth|
+        variables it assigns, and the subtrees are searched by a pool of that many
+        processes (see solve_subtrees), with the same results and statistics,
+        arc consistency counters included, as the sequential search. Each subtree
+        gets the deadline, and an equal share of the nodes, so a search that runs
+        out of budget may stop at a different point. |subproblems| is for the
+        processes: the subtrees to search instead of the whole tree.
+        """
+        start = time.time()
+        self.deadline = start + maxSeconds if maxSeconds is not None else None
+        self.maxNodes = maxNodes
         self.csp = csp
+        # The search runs on the array form of the CSP, see util.CompiledCSP.
+        self.compiled = util.CompiledCSP(csp)
         self.mcv = mcv
         self.ac3 = ac3
+        self.keepAssignments = keepAssignments
+        self.tallyBySum = tallyBySum
         self.reset_results()
 
-        # The dictionary of domains of every variable in the CSP.
-        self.domains = {var: list(self.csp.values[var]) for var in self.csp.variables}
-        self.max_assignment = collections.defaultdict(int)
+        # The domain of every variable in the CSP, as a list of value indexes.
+        self.domains = [range(len(values)) for values in self.compiled.values]
+        # Stack of (var, previous domain) of every domain change, see undo_domains.
+        self.trail = []
+        self.init_sum_bounds()
+        # Occurrences of every value index of every variable in the solutions, and
+        # the same by sum of the values of the solution for tallyBySum. They make
+        # max_assignment and max_assignment_by_sum once the search is over.
+        self.valueCounts = self.new_value_counts()
+        self.valueCountsBySum = collections.defaultdict(self.new_value_counts)
+        self.solutions = PackedSolutions(self.compiled, csp.variables if keepVariables is None else keepVariables)
+        # When set, backtrack stops at assignments of that many variables, and adds
+        # them to self.subproblems instead of searching below them.
+        self.splitDepth = None
 
         # Perform backtracking search.
-        if len(self.allAssignments) > 0:
+        if subproblems is not None:
+            for assignment, weight, share, domains in subproblems:
+                for var, domain in enumerate(domains):
+                    if domain != self.domains[var]:
+                        self.set_domain(var, domain)
+                # The root of the subtree was counted by the search that split it.
+                self.numOperations -= 1
+                self.backtrack(assignment, len(assignment), weight, share)
+                self.undo_domains(0)
+        elif processes is not None and processes > 1:
+            self.splitDepth = splitDepth
+            self.subproblems = []
+            # numOperations when each subtree was split off, to merge the statistics in order.
+            self.splitOperations = []
+            self.backtrack({}, 0, 1)
+            self.splitDepth = None
+            self.solve_subtrees(processes, keepVariables)
+        elif len(self.allAssignments) > 0:
             assignments_copy = self.allAssignments[:]
             self.allAssignments = []
             for assignment in assignments_copy:
                 if self.checkAssignment(assignment, changed_var_list):
-                    self.backtrack(assignment, len(assignment), 1)
+                    # Assigned variables only keep their value, for the sum bounds.
+                    indexes = {}
+                    for var, val in assignment.items():
+                        i = self.compiled.index[var]
+                        indexes[i] = self.compiled.values[i].index(val)
+                        self.set_domain(i, [indexes[i]])
+                    self.backtrack(indexes, len(indexes), 1, 1.0 / len(assignments_copy))
+                    self.undo_domains(0)
         else:
             self.backtrack({}, 0, 1)
+        if self.keepAssignments:
+            self.allAssignments = self.solutions
+        self.max_assignment = self.collect_tallies(self.valueCounts)
+        for total, counts in self.valueCountsBySum.items():
+            self.max_assignment_by_sum[total] = self.collect_tallies(counts)
         # Print summary of solutions.
-        self.print_stats()
+        if self.verbose:
+            self.print_stats()
+        if self.profiler is not None:
+            self.profiler.record("solve", variables=self.compiled.numVars,
+                                 constraints=len(self.compiled.cardinalityConstraints) +
+                                 sum(len(n) for n in self.compiled.neighbors) // 2,
+                                 nodes=self.numOperations, revisions=self.numRevisions,
+                                 pruned=self.numPrunedValues, dead_ends=self.numDeadEnds,
+                                 solutions=self.numAssignments, complete=self.complete,
+                                 searched=self.searchedFraction, seconds=time.time() - start)
 
     def checkAssignment(self, assignment, changed_var_list):
         for var in changed_var_list:
             if var not in assignment:
                 continue
-            if assignment[var] not in self.domains[var]:
+            if assignment[var] not in self.csp.values[var]:
                 return False
         return True
 
-    def backtrack(self, assignment, numAssigned, weight):
+    def backtrack(self, assignment, numAssigned, weight, share=1.0):
         """
         Perform the back-tracking algorithms to find all possible solutions to
-        the CSP.
+        the CSP. The search keeps its own stack instead of recursing once per
+        variable, and stops early when the budget of solve() runs out.
 
-        @param assignment: A dictionary of current assignment. Unassigned variables
-            do not have entries, while an assigned variable has the assigned value
-            as value in dictionary. e.g. if the domain of the variable A is [5,6],
-            and 6 was assigned to it, then assignment[A] == 6.
+        @param assignment: A dictionary of current assignment, from variable index
+            to value index, see get_delta_weight.
         @param numAssigned: Number of currently assigned variables
         @param weight: The weight of the current partial assignment.
+        @param share: The part of the whole search space under this assignment,
+            for searchedFraction.
         """
-        # if len(self.allAssignments) > 10:
-        #     print "we already have a lot of assignments"
-        #     return
-
-        self.numOperations += 1
-        assert weight > 0
-        if numAssigned == self.csp.numVars:
-            # A satisfiable solution have been found. Update the statistics.
-            self.numAssignments += 1
-            newAssignment = {}
-            for var in self.csp.variables:
-                self.max_assignment[(var, assignment[var])] += 1
-                newAssignment[var] = assignment[var]
-            self.allAssignments.append(newAssignment)
-
-            if len(self.optimalAssignment) == 0 or weight >= self.optimalWeight:
-                if weight == self.optimalWeight:
-                    self.numOptimalAssignments += 1
+        # One frame per assigned variable and the variable being assigned:
+        # [var, ordered_values, index of the next value to try, weight, share, trail mark]
+        stack = []
+        descend = True
+        while True:
+            if descend:
+                self.numOperations += 1
+                assert weight > 0
+                if self.out_of_budget():
+                    # Leave the assignment and the domains as they were given.
+                    self.complete = False
+                    for frame in stack:
+                        assignment.pop(frame[0], None)
+                    if stack:
+                        self.undo_domains(stack[0][5])
+                    return
+                if numAssigned == self.compiled.numVars:
+                    # A satisfiable solution have been found. Update the statistics.
+                    self.record_solution(assignment, weight)
+                    self.searchedFraction += share
+                elif self.splitDepth is not None and numAssigned >= self.splitDepth:
+                    # A subtree for solve_subtrees.
+                    self.subproblems.append((dict(assignment), weight, share, list(self.domains)))
+                    self.splitOperations.append(self.numOperations)
                 else:
-                    self.numOptimalAssignments = 1
-                self.optimalWeight = weight
-
-                self.optimalAssignment = newAssignment
-                if self.firstAssignmentNumOperations == 0:
-                    self.firstAssignmentNumOperations = self.numOperations
-            return
+                    # Select the next variable to be assigned, and get an ordering of the values.
+                    var = self.get_unassigned_variable(assignment)
+                    ordered_values = self.domains[var]
+                    if not ordered_values:
+                        self.searchedFraction += share
+                    else:
+                        stack.append([var, ordered_values, 0, weight, share / len(ordered_values), len(self.trail)])
+                descend = False
+            if not stack:
+                return
 
-        # Select the next variable to be assigned.
-        var = self.get_unassigned_variable(assignment)
-        # Get an ordering of the values.
-        ordered_values = self.domains[var]
-
-        # Continue the backtracking recursion using |var| and |ordered_values|.
-        if not self.ac3:
-            # When arc consistency check is not enabled.
-            for val in ordered_values:
+            # Continue with the next value of the deepest variable, restoring the
+            # previous domains if a value was being explored.
+            frame = stack[-1]
+            var, ordered_values, i, weight, share, mark = frame
+            if var in assignment:
+                self.undo_domains(mark)
+                del assignment[var]
+                numAssigned -= 1
+            while i < len(ordered_values) and not descend:
+                val = ordered_values[i]
+                i += 1
                 deltaWeight = self.get_delta_weight(assignment, var, val)
                 if deltaWeight > 0:
                     assignment[var] = val
-                    self.backtrack(assignment, numAssigned + 1, weight * deltaWeight)
-                    del assignment[var]
-        else:
-            for val in ordered_values:
-                deltaWeight = self.get_delta_weight(assignment, var, val)
-                if deltaWeight > 0:
-                    assignment[var] = val
-                    # create a deep copy of domains as we are going to look
-                    # ahead and change domain values
-                    localCopy = copy.deepcopy(self.domains)
                     # fix value for the selected variable so that hopefully we
-                    # can eliminate values for other variables
-                    self.domains[var] = [val]
+                    # can eliminate values for other variables (and for the sum bounds)
+                    self.set_domain(var, [val])
+                    # enforce arc consistency, and skip the branch if some
+                    # variable is left without any value
+                    if not self.ac3 or self.arc_consistency_check(var):
+                        descend = True
+                        numAssigned += 1
+                        weight *= deltaWeight
+                        continue
+                    self.numDeadEnds += 1
+                    self.undo_domains(mark)
+                    del assignment[var]
+                self.searchedFraction += share
+            frame[2] = i
+            if not descend:
+                stack.pop()
+
+    def record_solution(self, assignment, weight):
+        """
+        Updates the statistics with the complete |assignment| of |weight|.
+        """
+        self.numAssignments += 1
+        counts = self.valueCounts
+        for var, val in assignment.iteritems():
+            counts[var][val] += 1
+        if self.tallyBySum:
+            values = self.compiled.values
+            total = sum(values[var][val] for var, val in assignment.iteritems())
+            self.numAssignmentsBySum[total] += 1
+            counts = self.valueCountsBySum[total]
+            for var, val in assignment.iteritems():
+                counts[var][val] += 1
+        if self.keepAssignments:
+            self.solutions.append(assignment)
 
-                    # enforce arc consistency
-                    self.arc_consistency_check(var)
+        if len(self.optimalAssignment) == 0 or weight >= self.optimalWeight:
+            if weight == self.optimalWeight:
+                self.numOptimalAssignments += 1
+            else:
+                self.numOptimalAssignments = 1
+            if self.keepAssignments or weight != self.optimalWeight or not self.optimalAssignment:
+                self.optimalAssignment = {self.compiled.variables[var]: self.compiled.values[var][val]
+                                          for var, val in assignment.iteritems()}
+            self.optimalWeight = weight
+            if self.firstAssignmentNumOperations == 0:
+                self.firstAssignmentNumOperations = self.numOperations
 
-                    self.backtrack(assignment, numAssigned + 1, weight * deltaWeight)
-                    # restore the previous domains
-                    self.domains = localCopy
-                    del assignment[var]
+    def solve_subtrees(self, processes, keepVariables):
+        """
+        Searches the subtrees in self.subproblems on the pool of |processes|
+        processes, and merges their statistics into this search, as if it had
+        searched them itself in order.
+        """
+        seconds = max(self.deadline - time.time(), 0) if self.deadline is not None else None
+        nodes = None
+        if self.maxNodes is not None:
+            nodes = max(self.maxNodes - self.numOperations, 0) // max(len(self.subproblems), 1)
+        options = (self.mcv, self.ac3, self.keepAssignments, self.tallyBySum, seconds, nodes, keepVariables)
+        tasks = [(self.csp, subproblem, options) for subproblem in self.subproblems]
+        # In the order of the sequential search, the nodes of every subtree come right after its
+        # root, so a node of the split search is preceded by the nodes of the subtrees before it.
+        # The roots are already counted here, and the subtrees don't count them again.
+        splitFirst = self.firstAssignmentNumOperations
+        self.firstAssignmentNumOperations = 0
+        subtreeOperations = 0
+        results = solver_pool(processes).imap(solve_subtree, tasks)
+        for splitOperations, result in zip(self.splitOperations, results):
+            if self.firstAssignmentNumOperations == 0:
+                if splitFirst and splitFirst < splitOperations:
+                    self.firstAssignmentNumOperations = splitFirst + subtreeOperations
+                elif result['firstAssignmentNumOperations']:
+                    self.firstAssignmentNumOperations = (splitOperations + subtreeOperations +
+                                                         result['firstAssignmentNumOperations'])
+            subtreeOperations += result['numOperations']
+            for name in ('numAssignments', 'numOperations', 'numPrunedValues', 'numDeadEnds', 'numRevisions',
+                         'searchedFraction'):
+                setattr(self, name, getattr(self, name) + result[name])
+            self.complete = self.complete and result['complete']
+            self.add_value_counts(self.valueCounts, result['valueCounts'])
+            for total, counts in result['valueCountsBySum'].items():
+                self.numAssignmentsBySum[total] += result['numAssignmentsBySum'][total]
+                self.add_value_counts(self.valueCountsBySum[total], counts)
+            self.solutions.data += result['solutions']
+            self.solutions.count += result['numSolutions']
+            weight = result['optimalWeight']
+            if result['optimalAssignment'] and (len(self.optimalAssignment) == 0 or weight >= self.optimalWeight):
+                if weight == self.optimalWeight:
+                    self.numOptimalAssignments += result['numOptimalAssignments']
+                else:
+                    self.numOptimalAssignments = result['numOptimalAssignments']
+                if self.keepAssignments or weight != self.optimalWeight or not self.optimalAssignment:
+                    self.optimalAssignment = result['optimalAssignment']
+                self.optimalWeight = weight
+        if self.firstAssignmentNumOperations == 0 and splitFirst:
+            self.firstAssignmentNumOperations = splitFirst + subtreeOperations
+        self.subproblems = []
+        self.splitOperations = []
+
+    def add_value_counts(self, counts, other):
+        for varCounts, otherCounts in zip(counts, other):
+            for val, count in enumerate(otherCounts):
+                varCounts[val] += count
+
+    def new_value_counts(self):
+        return [[0] * len(values) for values in self.compiled.values]
+
+    def collect_tallies(self, counts):
+        """
+        Returns the occurrences of value index counts as a dictionary from
+        (var, val) to number of solutions, for the values that occur.
+        """
+        tallies = collections.defaultdict(int)
+        for keys, varCounts in zip(self.compiled.keys, counts):
+            for key, count in zip(keys, varCounts):
+                if count:
+                    tallies[key] = count
+        return tallies
+
+    def out_of_budget(self):
+        """
+        Whether the search has used up the node or time budget given to solve().
+        """
+        if self.maxNodes is not None and self.numOperations > self.maxNodes:
+            return True
+        return self.deadline is not None and time.time() > self.deadline
 
     def get_unassigned_variable(self, assignment):
         if not self.mcv:
-            for var in self.csp.variables:
+            for var in xrange(self.compiled.numVars):
                 if var not in assignment: return var
         else:
             min_num_valid_choices = float('inf')
             result = None
-            for var in self.csp.variables:
+            for var in xrange(self.compiled.numVars):
                 if var not in assignment:
                         l = [self.get_delta_weight(assignment, var, possible_value) for possible_value in self.domains[var]]
                         num_valid_choices = [i for i in l if i != 0]
@@ -193,73 +550,232 @@ class BacktrackingSearch():
             return result
 
     def arc_consistency_check(self, var):
+        """
+        Enforces arc consistency of the binary factors and the bounds of the
+        cardinality constraints, starting from the variable |var| whose domain
+        changed. Returns False if a domain becomes empty or a sum can't be reached.
+        """
         q = collections.deque([var])
         while len(q) > 0:
             v = q.popleft()
-            for var2 in self.csp.get_neighbor_vars(v):
-                v2_list = self.domains[var2][:]
-                for val2 in self.domains[var2]:
-                    all_values = [self.csp.binaryFactors[v][var2][val1][val2] for val1 in self.domains[v]]
-                    non_zero_values = [i for i in all_values if i != 0]
-                    if len(non_zero_values) == 0:
-                        v2_list.remove(val2)
-                if self.domains[var2] != v2_list:
+            self.numRevisions += len(self.compiled.neighbors[v]) + len(self.compiled.cardinalityConstraintsOf[v])
+            for var2, _, supports in self.compiled.neighbors[v]:
+                # The values of var2 supported by some value left for v.
+                supported = 0
+                for val1 in self.domains[v]:
+                    supported |= supports[val1]
+                domain = self.domains[var2]
+                v2_list = [val2 for val2 in domain if supported >> val2 & 1]
+                if len(v2_list) != len(domain):
                     q.append(var2)
-                self.domains[var2] = v2_list
-
-def get_sum_variable(csp, name, variables, maxSum):
-    for i, X_i in enumerate(variables):
-        A_i = ('sum', name, i)
-        csp.add_variable(A_i, [(x, y) for x in range(maxSum + 1) for y in range(maxSum + 1)])
-        csp.add_binary_factor(X_i, A_i, lambda val, b: b[1] == b[0] + val)
-        if i == 0:
-            csp.add_unary_factor(A_i, lambda b: b[0] == 0)
-        else:
-            csp.add_binary_factor(('sum', name, i - 1), A_i, lambda b1, b2: b1[1] == b2[0])
-    csp.add_unary_factor(A_i, lambda val: val[1] == maxSum)
+                    self.numPrunedValues += len(domain) - len(v2_list)
+                    self.set_domain(var2, v2_list)
+                    if not v2_list:
+                        return False
+            for c in self.compiled.cardinalityConstraintsOf[v]:
+                variables, k = self.compiled.cardinalityConstraints[c]
+                if self.sumLow[c] > k or self.sumHigh[c] < k:
+                    return False
+                if min(k - self.sumLow[c], self.sumHigh[c] - k) >= self.sumSpread[c]:
+                    continue
+                # Keep the values for which the sum can still be k.
+                for var2 in variables:
+                    domain = self.domains[var2]
+                    if len(domain) < 2:
+                        continue
+                    values = self.compiled.values[var2]
+                    numbers = [values[a] for a in domain]
+                    low, high = self.sumLow[c] - min(numbers), self.sumHigh[c] - max(numbers)
+                    v2_list = [a for a, value in zip(domain, numbers) if low + value <= k and high + value >= k]
+                    if len(v2_list) != len(domain):
+                        q.append(var2)
+                        self.numPrunedValues += len(domain) - len(v2_list)
+                        self.set_domain(var2, v2_list)
+                        if not v2_list:
+                            return False
+        return True
+
+# Returns the constraints the revealed numbers of |board| (a PlayerBoard) put on its frontier:
+# a sorted list of (cells, k), meaning exactly k of the unknown tiles |cells| are mines.
+def frontier_constraints(board):
+    numbers = set()
+    for x, y in board.frontier:
+        for p in board.neighbours(x, y):
+            if board.cells[p] >= 0:
+                numbers.add(p)
+    constraints = set()
+    for x, y in numbers:
+        cells = tuple(sorted(board.unknownNeighbours(x, y)))
+        constraints.add((cells, int(board.cells[x, y]) - int(board.mine_neighbours[x, y])))
+    return sorted(constraints)
+
+# Splits constraints into connected components: two constraints are in the same component when
+# they share a cell, directly or through other constraints. Components can be solved separately.
+def connected_components(constraints):
+    parent = {}
+    def find(cell):
+        while parent[cell] != cell:
+            parent[cell] = parent[parent[cell]]
+            cell = parent[cell]
+        return cell
+    for cells, _ in constraints:
+        for cell in cells:
+            parent.setdefault(cell, cell)
+        root = find(cells[0])
+        for cell in cells[1:]:
+            parent[find(cell)] = root
+    components = collections.defaultdict(list)
+    for constraint in constraints:
+        components[find(constraint[0][0])].append(constraint)
+    return [tuple(c) for c in components.values()]
+
+# Counts the solutions of one component (a tuple of constraints) by number of mines, within the
+# given budget (see BacktrackingSearch.solve). Returns a dictionary from the number of mines m to
+# (number of solutions with m mines, number of those solutions where each cell is a mine), whether
+# the search was complete, and the number of nodes it took. With processes, components of at
+# least PARALLEL_MIN_CELLS cells are searched by that many processes. The metrics of the solve go
+# to profiler, BacktrackingSearch.profiler by default.
+PARALLEL_MIN_CELLS = 40
+
+def solve_component(constraints, maxSeconds=None, maxNodes=None, processes=None, profiler=None):
+    csp = util.CSP()
+    cells = sorted(set(cell for cs, _ in constraints for cell in cs))
+    for cell in cells:
+        csp.add_variable(cell, [0, 1])
+    for cs, k in constraints:
+        csp.add_cardinality_constraint(cs, k)
+    solver = BacktrackingSearch()
+    if profiler is not None:
+        solver.profiler = profiler
+    if len(cells) < PARALLEL_MIN_CELLS:
+        processes = None
+    solver.solve(csp, [], False, True, keepAssignments=False, tallyBySum=True,
+                 maxSeconds=maxSeconds, maxNodes=maxNodes, processes=processes)
+    tallies = {m: (n, {cell: solver.max_assignment_by_sum[m][(cell, 1)] for cell in cells})
+               for m, n in solver.numAssignmentsBySum.items()}
+    return tallies, solver.complete, solver.numOperations
+
+# Numbers proportional to C(n, total - m), the number of ways to place the mines left by a
+# solution with m mines among the interior cells, for every m of ms. Only the ratios of the
+# weights matter, so they are built from the ratio C(n, k + 1) / C(n, k) = (n - k) / (k + 1) over
+# the range of ms, without computing any binomial of the size of the board.
+# Returns a dictionary from m to weight, without the m whose weight is 0.
+def interior_weights(n, total, ms):
+    if not ms:
+        return {}
+    low = max(total - max(ms), 0)
+    high = min(total - min(ms), n)
+    if low > high:
+        return {}
+    # C(n, k) / C(n, low) * (low + 1) * ... * high, for k from low to high: the product of
+    # n - low, ..., n - k + 1 and of k + 1, ..., high.
+    falling = [1]
+    for k in xrange(low, high):
+        falling.append(falling[-1] * (n - k))
+    rising = [1]
+    for k in xrange(high, low, -1):
+        rising.append(rising[-1] * k)
+    weights = {}
+    for m in ms:
+        k = total - m
+        if low <= k <= high:
+            weights[m] = falling[k - low] * rising[high - k]
+    return weights
+
+# Number of solutions of several components together, by total number of mines.
+# @params: counts is a list of dictionaries from a number of mines to a number of solutions
+def convolve_counts(counts):
+    total = {0: 1}
+    for count in counts:
+        combined = collections.defaultdict(int)
+        for m1, n1 in total.items():
+            for m2, n2 in count.items():
+                combined[m1 + m2] += n1 * n2
+        total = combined
+    return total
+
+# Exact probability of being a mine of the cells of the frontier components and of the interior
+# cells. Every solution of the components is weighted by the number of ways to place the mines it
+# leaves among the interior cells: C(num_interior, mines_left - mines in the solution).
+# Past the deadline (time.time() value, None for none), the cells of the components left are
+# left out; the first component and the interior always get their probabilities.
+# @params: solved is a list of solve_component results
+# Returns a dictionary from frontier cell to Fraction, and the Fraction of an interior cell
+# (None without interior cells).
+def mine_probabilities(solved, num_interior, mines_left, deadline=None):
+    counts = [{m: n for m, (n, _) in tallies.items()} for tallies in solved]
+    # Solutions of the components before i, and of the components after i, by number of mines.
+    before = [{0: 1}]
+    for count in counts:
+        before.append(convolve_counts([before[-1], count]))
+    after = [{0: 1}]
+    for count in reversed(counts):
+        after.append(convolve_counts([after[-1], count]))
+    after.reverse()
+    total = before[-1]
+    weights = interior_weights(num_interior, mines_left, list(total))
+    num_boards = sum(n * weights.get(m, 0) for m, n in total.items())
+    if num_boards == 0:
+        # Only possible with the partial solutions of a search that ran out of budget.
+        return {}, None
+    probabilities = {}
+    for i, tallies in enumerate(solved):
+        if i > 0 and deadline is not None and time.time() > deadline:
+            break
+        # Solutions of the other components, by number of mines.
+        others = convolve_counts([before[i], after[i + 1]])
+        mines = collections.defaultdict(int)
+        for m, (_, num_mines) in tallies.items():
+            weight = sum(n * weights.get(m + m2, 0) for m2, n in others.items())
+            for cell, n in num_mines.items():
+                mines[cell] += n * weight
+        for cell, n in mines.items():
+            probabilities[cell] = Fraction(n, num_boards)
+    interior = None
+    if num_interior > 0:
+        interior_mines = sum(n * weights.get(m, 0) * (mines_left - m) for m, n in total.items())
+        interior = Fraction(interior_mines, num_boards * num_interior)
+    return probabilities, interior
+
+# Backends counting the solutions of a frontier component, by name (see solve_component).
+SOLVERS = {'backtracking': solve_component, 'sat': sat.solve_component, 'transfer': transfer.solve_component}
 
 class CspAIPlayer(AIPlayer):
+    # Name of the backend in SOLVERS solving the components, and number of processes it may use.
+    # The default auto is transfer on the boards long in one direction (see suits), backtracking
+    # on the others.
+    solver = 'auto'
+    processes = None
+    # Budget of one move, in seconds and in search nodes (None for no limit). The seconds cover
+    # the deductions, the solving of the components and the combination of their solutions into
+    # probabilities, from the start of chooseFromSolver; the nodes cover the solving only.
+    # Deductions stop with what they found, components that don't fit get probabilities estimated
+    # from the solutions found, and the combination leaves out the cells of the components left.
+    # Building the frontier equations isn't covered, it takes time linear in the frontier.
+    move_seconds = None
+    move_nodes = None
+    # Solutions of components by pattern, shared by the games of the process (see PatternCache).
+    pattern_cache = PatternCache()
+    # profiling.Profiler recording the metrics of every move, if any.
+    profiler = None
+    # Whether to try the deductions that need no search (see deduceFromFrontier) before solving.
+    deduction = True
+
     def run(self, save_log=True):
-        print self.seed
-        csp = util.CSP()
-        solver = BacktrackingSearch()
+        # Solutions of the components of the frontier, by component. A component is only solved
+        # again when a reveal changes its constraints.
+        self.solved_components = {}
         # First action is always (0,0).
         chance_flag = float(self.num_mines) / (self.length * self.width)
-        a = ("flag", 0, 0) if random.random() < chance_flag else ("click", 0, 0)
+        a = ("flag", 0, 0) if self.rng.random() < chance_flag else ("click", 0, 0)
         self.num_flags_remaining = self.length * self.width
-        added_variables = {(0, 0): 1}
         self.move(a[0], a[1], a[2])
-        csp.add_variable((0, 0), [0, 1])
-        sum_added = False
-        list_changed_var = []
-        known_tiles_to_explore = {}
+        known_tiles_to_explore = collections.OrderedDict()
         while not self.gameEnds():
-            # print a
-            # self.printPlayerBoard()
-            revealed_tile = self.currentPlayerBoard[a[1]][a[2]]
-            csp.values[(a[1], a[2])] = [0] if revealed_tile >= 0 else [1]
-            list_changed_var.append((a[1], a[2]))
-            # print "revealed tile is: " + str(revealed_tile)
-            list_surrounding_tiles = [(x1, y1) for x1 in range(a[1] - 1, a[1] + 2) if x1 >= 0 and x1 < self.length for y1 in range(a[2] - 1, a[2] + 2) if y1 >= 0 and y1 < self.width]
-            for x in list_surrounding_tiles:
-                if x not in added_variables:
-                    csp.add_variable(x, [0, 1])
-                    added_variables[x] = 1
-            if revealed_tile != -1:
-                get_sum_variable(csp, "sum:(" + str(a[1]) + "," + str(a[2]) + ")", list_surrounding_tiles, revealed_tile)
-            if len(added_variables) == self.length * self.width and not sum_added:
-                get_sum_variable(csp, "totalSum", list(added_variables.keys()), self.num_mines)
-                sum_added = True
             if len(known_tiles_to_explore) == 0:
-                solver.solve(csp, list_changed_var, False, True)
-                list_changed_var = []
-                for pos, value in self.findMostOccurredPos(solver):
-                    if pos not in known_tiles_to_explore:
-                        known_tiles_to_explore[pos] = value
-            else:
-                print "NOT calling solver - saves time ;)"
-            pos = known_tiles_to_explore.keys()[0]
-            value = known_tiles_to_explore.pop(pos)
+                for pos, value in self.chooseFromSolver():
+                    known_tiles_to_explore[pos] = value
+            pos, value = known_tiles_to_explore.popitem(last=False)
             if value == 0:
                 a = ("click", pos[0], pos[1])
             else:
@@ -269,16 +785,119 @@ class CspAIPlayer(AIPlayer):
             self.save('csp')
         return self.score, self.correct_moves, self.correct_mines
 
-    def findMostOccurredPos(self, solver):
-        d = copy.deepcopy(solver.max_assignment)
-        for k in solver.max_assignment.keys():
-            if type(k[0][0]) != int or type(k[0][1]) != int:
-                del d[k]
-            elif self.currentPlayerBoard[k[0][0]][k[0][1]] != 'x':
-                del d[k]
-        maxOccurred = d[max(d, key=d.get)]
-        maxL = []
-        for k in d.keys():
-            if d[k] == maxOccurred:
-                maxL.append(k)
-        return maxL
+    # Returns the name in SOLVERS of the backend to use on that component of the frontier. The
+    # components too wide for transfer (see transfer.fits) fall back to backtracking.
+    def solverName(self, component):
+        name = self.solver
+        if name == 'auto':
+            name = 'transfer' if transfer.suits(self.length, self.width) else 'backtracking'
+        if name == 'transfer' and not transfer.fits(component):
+            name = 'backtracking'
+        return name
+
+    # Returns the exact probability of being a mine of every frontier tile, and of any interior
+    # tile. Each connected component of the frontier is solved on its own, and the number of mines
+    # left ties them together with the interior (see mine_probabilities). Components the move
+    # budget doesn't cover are left out, or estimated from the solutions found: their cells are
+    # in self.estimated_cells, and the interior probability is an estimate too when it's not empty.
+    # The deadline of the move defaults to move_seconds from now.
+    def mineProbabilities(self, deadline=None):
+        start = time.time()
+        components = connected_components(frontier_constraints(self.playerBoard))
+        if deadline is None and self.move_seconds is not None:
+            deadline = start + self.move_seconds
+        nodes_left = self.move_nodes
+        solved = {}
+        tallies = []
+        self.estimated_cells = set()
+        # Components of the previous move, found in the pattern cache, and solved.
+        num_reused, num_cache_hits, num_solved, total_nodes = 0, 0, 0, 0
+        for component in components:
+            if component in self.solved_components:
+                solved[component] = self.solved_components[component]
+                tallies.append(solved[component])
+                num_reused += 1
+                continue
+            cached = self.pattern_cache.get(component)
+            if cached is not None:
+                solved[component] = cached
+                tallies.append(cached)
+                num_cache_hits += 1
+                continue
+            seconds = max(deadline - time.time(), 0) if deadline is not None else None
+            solve = SOLVERS[self.solverName(component)]
+            component_tallies, complete, num_nodes = solve(component, seconds, nodes_left, self.processes,
+                                                           BacktrackingSearch.profiler)
+            num_solved += 1
+            total_nodes += num_nodes
+            if nodes_left is not None:
+                nodes_left = max(nodes_left - num_nodes, 0)
+            if complete:
+                solved[component] = component_tallies
+                self.pattern_cache.put(component, component_tallies)
+            else:
+                self.estimated_cells.update(cell for cells, _ in component for cell in cells)
+            if component_tallies:
+                tallies.append(component_tallies)
+        # Only complete solutions are kept for the next moves.
+        self.solved_components = solved
+        probabilities = mine_probabilities(tallies, self.playerBoard.numInterior(),
+                                           self.num_mines - len(self.currentMines), deadline)
+        if self.profiler is not None:
+            self.profiler.record("move", seed=self.seed, frontier=len(self.playerBoard.frontier),
+                                 unknown=self.playerBoard.num_unknown, components=len(components),
+                                 reused=num_reused, cache_hits=num_cache_hits, solved=num_solved,
+                                 nodes=total_nodes, estimated=len(self.estimated_cells),
+                                 seconds=time.time() - start)
+        return probabilities
+
+    # Returns the tiles that the frontier equations decide without any search (see
+    # deduction.deduce), as a dictionary from position to value, 1 for a mine. When there is no
+    # interior tile, the number of mines left is one more equation, over the whole frontier.
+    # The deadline of the move defaults to move_seconds from now.
+    def deduceFromFrontier(self, deadline=None):
+        start = time.time()
+        if deadline is None and self.move_seconds is not None:
+            deadline = start + self.move_seconds
+        constraints = frontier_constraints(self.playerBoard)
+        if constraints and self.playerBoard.numInterior() == 0:
+            cells = tuple(sorted(self.playerBoard.frontier))
+            groups = [constraints + [(cells, self.num_mines - len(self.currentMines))]]
+        else:
+            groups = connected_components(constraints)
+        deduced = {}
+        for group in groups:
+            if deadline is not None and time.time() > deadline:
+                break
+            deduced.update(deduce(list(group), deadline))
+        if self.profiler is not None:
+            self.profiler.record("deduction", seed=self.seed, frontier=len(self.playerBoard.frontier),
+                                 deduced=len(deduced), seconds=time.time() - start)
+        return deduced
+
+    # Returns a list of (position, value) to play, value being 1 for a mine: every tile deduced
+    # without search, or else every tile the solver is sure of (estimates never are), or else the
+    # tile it is the most confident about, a random interior tile when it beats the frontier.
+    # Without any frontier, a random unknown tile, flagged with the probability of a tile being
+    # a mine.
+    def chooseFromSolver(self):
+        deadline = time.time() + self.move_seconds if self.move_seconds is not None else None
+        if self.deduction:
+            deduced = self.deduceFromFrontier(deadline)
+            if deduced:
+                return sorted(deduced.items())
+        probabilities, interior = self.mineProbabilities(deadline)
+        sure = [(pos, int(p)) for pos, p in sorted(probabilities.items())
+                if p in (0, 1) and pos not in self.estimated_cells]
+        if interior in (0, 1) and not self.estimated_cells:
+            sure += [(pos, int(interior)) for pos in self.playerBoard.interiorCells()]
+        if sure:
+            return sure
+        if probabilities:
+            pos, p = max(sorted(probabilities.items()), key=lambda item: abs(item[1] - 0.5))
+            if interior is not None and abs(interior - Fraction(1, 2)) > abs(p - Fraction(1, 2)):
+                pos, p = self.rng.choice(self.playerBoard.interiorCells()), interior
+            return [(pos, 1 if p > Fraction(1, 2) else 0)]
+        pos = self.rng.choice(self.playerBoard.unknownCells())
+        chance_flag = float(self.num_mines - len(self.currentMines)) / self.playerBoard.num_unknown
+        return [(pos, 1 if self.rng.random() < chance_flag else 0)]
@@ -0,0 +1,94 @@
+import time
+from fractions import gcd
+
+# Deductions on the frontier equations that need no search: each constraint (cells, k) of
+# csp.frontier_constraints says that the 0/1 mine variables of cells sum to k.
+
+# Subset rule: when the cells of a constraint A are all in a constraint B, the cells of B not in A
+# hold k_B - k_A mines, so they are all safe when that is 0 and all mines when it is their number.
+# Returns a dictionary from cell to 0 (safe) or 1 (mine), with what was found by the deadline.
+def subset_deductions(constraints, deadline=None):
+    deduced = {}
+    sets = [(set(cells), k) for cells, k in constraints]
+    for a, k_a in sets:
+        if deadline is not None and time.time() > deadline:
+            break
+        for b, k_b in sets:
+            if len(a) < len(b) and a <= b:
+                rest = b - a
+                if k_b - k_a == 0 or k_b - k_a == len(rest):
+                    value = 1 if k_b > k_a else 0
+                    for cell in rest:
+                        deduced[cell] = value
+    return deduced
+
+# Gaussian elimination of the equations over the integers, to reduced row echelon form. In a row
+# sum(c_i * x_i) = b with 0/1 variables, b is at least the sum of the negative c_i and at most
+# the sum of the positive ones: reaching a bound fixes every variable of the row.
+# At the deadline, the elimination stops and the bounds are checked on the rows reached so far,
+# which are equations of the constraints all the same.
+# Returns a dictionary from cell to 0 (safe) or 1 (mine).
+def gaussian_deductions(constraints, deadline=None):
+    rows = [(dict((cell, 1) for cell in cells), k) for cells, k in constraints]
+    pivots = 0
+    for cell in sorted(set(cell for cells, _ in constraints for cell in cells)):
+        if deadline is not None and time.time() > deadline:
+            break
+        pivot = next((i for i in range(pivots, len(rows)) if rows[i][0].get(cell)), None)
+        if pivot is None:
+            continue
+        rows[pivots], rows[pivot] = rows[pivot], rows[pivots]
+        coeffs, b = rows[pivots]
+        p = coeffs[cell]
+        for i, (other, other_b) in enumerate(rows):
+            o = other.get(cell)
+            if i == pivots or not o:
+                continue
+            # other * p - row * o, which has no |cell|, reduced by the gcd of its numbers.
+            combined = dict((c, v * p) for c, v in other.items())
+            for c, v in coeffs.items():
+                combined[c] = combined.get(c, 0) - v * o
+            combined = dict((c, v) for c, v in combined.items() if v)
+            combined_b = other_b * p - b * o
+            divisor = reduce(gcd, combined.values(), combined_b)
+            if divisor < 0:
+                divisor = -divisor
+            if divisor > 1:
+                combined = dict((c, v // divisor) for c, v in combined.items())
+                combined_b //= divisor
+            rows[i] = (combined, combined_b)
+        pivots += 1
+    deduced = {}
+    for coeffs, b in rows:
+        if not coeffs:
+            continue
+        high = sum(v for v in coeffs.values() if v > 0)
+        low = sum(v for v in coeffs.values() if v < 0)
+        if b == high or b == low:
+            for c, v in coeffs.items():
+                deduced[c] = int((v > 0) == (b == high))
+    return deduced
+
+# Removes the cells of known from the constraints, counting their mines.
+def substitute(constraints, known):
+    result = []
+    for cells, k in constraints:
+        rest = tuple(cell for cell in cells if cell not in known)
+        if rest:
+            result.append((rest, k - sum(known[cell] for cell in cells if cell in known)))
+    return result
+
+# Applies the subset rule and Gaussian elimination to the constraints (one connected component
+# of the frontier, to keep the elimination small) until they deduce nothing more, or until the
+# deadline (time.time() value, None for none).
+# Returns a dictionary from cell to 0 (safe) or 1 (mine), empty when the search is needed.
+def deduce(constraints, deadline=None):
+    known = {}
+    while constraints:
+        deduced = subset_deductions(constraints, deadline)
+        deduced.update(gaussian_deductions(constraints, deadline))
+        known.update(deduced)
+        if not deduced or (deadline is not None and time.time() > deadline):
+            break
+        constraints = substitute(constraints, deduced)
+    return known
@@ -2,13 +2,31 @@
 import os
 import random
 import sys
+import time
 from Player import Player
 from Player import BaselineAIPlayer
 from RLPlayer import RLPlayer
-from csp import CspAIPlayer
-from Grid import Grid
+from csp import BacktrackingSearch, CspAIPlayer
+from pattern_cache import PatternCache
+from profiling import Profiler
+from Grid import Grid, GRID_CLASSES
+from logger import Logger, convert_yaml_log, ingest_logs
+from catalog import Catalog
+from replay import verify_logs
+
+# Removes "--name=value" from the command line and returns value (or default if absent),
+# so that the positional arguments keep their indexes.
+def pop_option(name, default):
+    prefix = "--" + name + "="
+    for arg in sys.argv[1:]:
+        if arg.startswith(prefix):
+            sys.argv.remove(arg)
+            return arg[len(prefix):]
+    return default
 
 def main():
+    grid_class = GRID_CLASSES[pop_option("grid", Grid.name)]
+    Logger.format = pop_option("log-format", Logger.format)
     # To be overridden
     if len(sys.argv) < 2:
         help_msg = """
@@ -17,6 +35,19 @@ def main():
         python game.py gui (gui interface)
         python game.py baseline 10 10 10 - to start a baseline AI with 10*10 board with 10 mines
         python game.py baseline 10 10 10 100 - to start a baseline AI with 10*10 board with 10 mines, 100 times
+        python game.py baseline 1000 1000 100000 --grid=array - numpy backed board, for large boards
+        python game.py csp 10 10 10 100 --log-format=binary - write compact binary logs instead of yaml
+        python game.py csp 10 10 10 1000 --log-format=background - binary logs batched into a few files by a background thread
+        python game.py csp 16 30 99 10 --move-seconds=0.5 --move-nodes=100000 - cap the solver time and nodes of each move
+        python game.py csp 16 30 99 10 --pattern-cache=logs/patterns.db - keep the solved frontier patterns in a file, for later runs
+        python game.py csp 16 30 99 10 --solver=sat - solve the frontier with the CDCL SAT backend instead of backtracking
+        python game.py csp 8 200 300 10 --solver=transfer - column by column dynamic programming (the default on such strips)
+        python game.py csp 16 30 99 10 --processes=8 - split the search of large frontier components over 8 processes
+        python game.py csp 16 30 99 10 --profile=solver.jsonl - write the metrics of every solve and move as JSON lines
+        python game.py convert logs/ - write a binary copy of every yaml log of a directory (or of the given files)
+        python game.py catalog [rebuild] - add the logs missing from the catalog of logs/ (or rebuild it)
+        python game.py stats csp 10 10 20 --days=7 - mean score of csp on 10*10 boards with 20 mines, last 7 days, from the catalog
+        python game.py verify logs/ - replay every logged game headless, in parallel, and report score mismatches
         """
         print(help_msg)
         return
@@ -74,7 +105,7 @@ def main():
         correct_moves = 0.0
         correct_mines = 0.0
         for _ in range(num_run):
-            player = BaselineAIPlayer(int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]))
+            player = BaselineAIPlayer(int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]), grid_class=grid_class)
             current_score, current_correct_moves, current_correct_mines = player.run()
             score += current_score
             correct_moves += current_correct_moves
@@ -94,14 +125,25 @@ def main():
         print "Average correct mines is: " + str(correct_mines)
 
     elif sys.argv[1] == "csp":
+        move_seconds, move_nodes = pop_option("move-seconds", None), pop_option("move-nodes", None)
+        CspAIPlayer.move_seconds = float(move_seconds) if move_seconds else None
+        CspAIPlayer.move_nodes = int(move_nodes) if move_nodes else None
+        pattern_file = pop_option("pattern-cache", None)
+        if pattern_file:
+            CspAIPlayer.pattern_cache = PatternCache(path=pattern_file)
+        CspAIPlayer.solver = pop_option("solver", CspAIPlayer.solver)
+        processes = pop_option("processes", None)
+        CspAIPlayer.processes = int(processes) if processes else None
+        profile_file = pop_option("profile", None)
+        if profile_file:
+            BacktrackingSearch.profiler = CspAIPlayer.profiler = Profiler(path=profile_file)
         num_run = 1 if len(sys.argv) < 6 else int(sys.argv[5])
-        sys.setrecursionlimit(5000)
         score = 0.0
         correct_moves = 0.0
         correct_mines = 0.0
         for _ in range(num_run):
             print _
-            player = CspAIPlayer(int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]))
+            player = CspAIPlayer(int(sys.argv[2]), int(sys.argv[3]), int(sys.argv[4]), grid_class=grid_class)
             current_score, current_correct_moves, current_correct_mines = player.run()
             score += current_score
             correct_moves += current_correct_moves
@@ -110,6 +152,33 @@ def main():
         print "Average correct moves is: " + str(correct_moves / num_run)
         print "Average correct mines is: " + str(correct_mines / num_run)
 
+    elif sys.argv[1] == "convert":
+        for path in sys.argv[2:]:
+            files = [os.path.join(path, f) for f in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+            for yml_file in files:
+                if yml_file.endswith(".yml"):
+                    print convert_yaml_log(yml_file)
+
+    elif sys.argv[1] == "catalog":
+        rebuild = len(sys.argv) > 2 and sys.argv[2] == "rebuild"
+        print "Added %d games to the catalog" % ingest_logs(os.path.join(os.getcwd(), "logs"), rebuild)
+
+    elif sys.argv[1] == "stats":
+        days = pop_option("days", None)
+        since = time.time() - float(days) * 24 * 3600 if days else None
+        args = sys.argv[2:]
+        agent = args.pop(0) if args and not args[0].isdigit() else None
+        length, width, num_mines = [int(a) for a in args] if len(args) == 3 else (None, None, None)
+        catalog = Catalog(os.path.join(os.getcwd(), "logs"))
+        for row in catalog.summary(agent, length, width, num_mines, since):
+            print "%s %d*%d, %d mines: %d games, mean score %f (min %d, max %d)" % row
+
+    elif sys.argv[1] == "verify":
+        num_files, mismatches = verify_logs(sys.argv[2:])
+        for file, index, logged, replayed, error in mismatches:
+            print "%s (game %s): logged score %s, replayed score %s - %s" % (file, index, logged, replayed, error)
+        print "Verified %d files, %d mismatches" % (num_files, len(mismatches))
+
     elif sys.argv[1] == 'simulate':
         command = "python simulator.py simulate {}".format(sys.argv[2])
         print command
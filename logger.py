@@ -1,8 +1,35 @@
 import yaml
 import os
+import struct
+import time
+import atexit
+import threading
+import Queue
 import datetime as dt
+from catalog import Catalog
+
+# Binary game logs: a file is a sequence of games, each one a fixed HEADER, the name of the
+# agent and of the grid, then one RECORD (action, x, y) per action - so games can simply be
+# appended to a file. All numbers are little endian.
+BINARY_EXTENSION = ".mlog"
+MAGIC = b"MSWL"
+VERSION = 1
+# magic, version, length, width, num_mines, seed, final score, unix time, number of actions,
+# length of the agent name, length of the grid name.
+HEADER = struct.Struct("<4sBHHIIiIIBB")
+RECORD = struct.Struct("<BHH")
+ACTIONS = ["click", "flag", "hint"]
+ACTION_CODES = {action: i for i, action in enumerate(ACTIONS)}
+# Format of the date in the names of the log files.
+DATE_FORMAT = "%Y%d%m_%H%M%S"
 
 class Logger:
+    # Format of the files written by write(): "yaml", "binary", or "background" for binary
+    # logs appended to a rolling file by a BackgroundWriter.
+    format = "yaml"
+    # Whether the games written are added to the Catalog of the log directory.
+    catalog = True
+
     def __init__(self, length, width, num_mines,  seed, file=None):
         self.file = file
         self.game_config = {}
@@ -17,15 +44,259 @@ class Logger:
 
     def write(self, agent, final_score):
         log_dir = os.path.join(os.getcwd(), "logs")
+        game = {
+            'agent': agent,
+            'timestamp': int(time.time()),
+            'config': dict(self.game_config),
+            'final_score': final_score,
+            'num_actions': len(self.actions)
+        }
+        if self.format == "background":
+            data = encode_game(agent, self.game_config, final_score, self.actions, game['timestamp'])
+            background_writer(log_dir).write(data, game if self.catalog else None)
+            return
+        extension = BINARY_EXTENSION if self.format == "binary" else ".yml"
         if not self.file:
-            file_name = "{}-{}_{}_{}.yml".format(agent, dt.datetime.now().strftime("%Y%d%m_%H%M%S"), self.game_config['seed'], final_score)
+            file_name = "{}-{}_{}_{}{}".format(agent, dt.datetime.now().strftime(DATE_FORMAT), self.game_config['seed'], final_score, extension)
             self.file = os.path.join(log_dir, file_name)
         if not os.path.exists(log_dir):
             os.makedirs(log_dir)
 
-        with open(self.file, 'w') as fh:
-            yaml.dump({
-                'config': self.game_config,
-                'final_score': final_score,
-                'actions': self.actions
-            }, fh, indent=4, default_flow_style=False, width=1000)
+        position = 0
+        if self.format == "binary":
+            position = os.path.getsize(self.file) if os.path.exists(self.file) else 0
+            with open(self.file, 'ab') as fh:
+                fh.write(encode_game(agent, self.game_config, final_score, self.actions, game['timestamp']))
+        else:
+            with open(self.file, 'w') as fh:
+                yaml.dump({
+                    'config': self.game_config,
+                    'final_score': final_score,
+                    'actions': self.actions
+                }, fh, indent=4, default_flow_style=False, width=1000)
+        if self.catalog:
+            thread_catalog(os.path.dirname(self.file)).add([(self.file, position, game)])
+
+# One Catalog per thread and log directory, as sqlite connections can't be shared by threads.
+thread_catalogs = threading.local()
+
+def thread_catalog(log_dir):
+    if not hasattr(thread_catalogs, 'catalogs'):
+        thread_catalogs.catalogs = {}
+    if log_dir not in thread_catalogs.catalogs:
+        thread_catalogs.catalogs[log_dir] = Catalog(log_dir)
+    return thread_catalogs.catalogs[log_dir]
+
+# Writes binary game logs from a thread, so that agents playing thousands of games don't wait
+# for the disk: Logger.write queues the games, which are appended in batches to a rolling file
+# of log_dir (a new file every max_file_size bytes). A batch is flushed once it reaches
+# flush_size bytes or flush_interval seconds, and everything left is flushed at exit.
+# The games written come with their catalog entry, added to the Catalog after every flush.
+class BackgroundWriter(threading.Thread):
+    flush_size = 1 << 20
+    flush_interval = 1.0
+    max_file_size = 64 << 20
+
+    def __init__(self, log_dir):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.log_dir = log_dir
+        self.queue = Queue.Queue()
+        self.file = None
+        self.file_size = 0
+        self.num_files = 0
+        self.start()
+
+    # @params: game: the catalog entry of the game (as for Catalog.add), or None.
+    def write(self, data, game=None):
+        self.queue.put((data, game))
+
+    # Writes everything queued so far and stops the thread.
+    def close(self):
+        self.queue.put(None)
+        self.join()
+
+    def run(self):
+        batch, size = [], 0
+        deadline = time.time() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(timeout=max(deadline - time.time(), 0))
+            except Queue.Empty:
+                item = (b"", None)
+            if item is None:
+                self.flush(batch)
+                return
+            if item[0]:
+                batch.append(item)
+                size += len(item[0])
+            if size >= self.flush_size or time.time() >= deadline:
+                self.flush(batch)
+                batch, size = [], 0
+                deadline = time.time() + self.flush_interval
+
+    def flush(self, batch):
+        if not batch:
+            return
+        if self.file is None or self.file_size >= self.max_file_size:
+            self.num_files += 1
+            file_name = "games-{}_{}_{}{}".format(dt.datetime.now().strftime(DATE_FORMAT), os.getpid(), self.num_files, BINARY_EXTENSION)
+            self.file = os.path.join(self.log_dir, file_name)
+            self.file_size = 0
+        if not os.path.exists(self.log_dir):
+            os.makedirs(self.log_dir)
+        games = []
+        for data, game in batch:
+            if game is not None:
+                games.append((self.file, self.file_size, game))
+            self.file_size += len(data)
+        with open(self.file, 'ab') as fh:
+            fh.write(b"".join(data for data, _ in batch))
+        if games:
+            thread_catalog(self.log_dir).add(games)
+
+# One BackgroundWriter per log directory, closed at exit.
+background_writers = {}
+background_writers_lock = threading.Lock()
+
+def background_writer(log_dir):
+    with background_writers_lock:
+        if log_dir not in background_writers:
+            background_writers[log_dir] = BackgroundWriter(log_dir)
+        return background_writers[log_dir]
+
+@atexit.register
+def close_background_writers():
+    with background_writers_lock:
+        for writer in background_writers.values():
+            writer.close()
+        background_writers.clear()
+
+# Returns the binary log of one game. timestamp defaults to now.
+def encode_game(agent, config, final_score, actions, timestamp=None):
+    timestamp = int(time.time()) if timestamp is None else timestamp
+    agent = agent.encode("ascii")
+    grid = config.get('grid', "").encode("ascii")
+    header = HEADER.pack(MAGIC, VERSION, config['length'], config['width'], config['num_mines'], config['seed'],
+                         final_score, timestamp, len(actions), len(agent), len(grid))
+    records = [RECORD.pack(ACTION_CODES[action], x, y) for action, x, y in actions]
+    return header + agent + grid + b"".join(records)
+
+# Returns the list of games in a binary log. Each game is a dictionary with the keys of the
+# YAML logs ('config', 'final_score', 'actions') plus 'agent' and 'timestamp'.
+def read_binary_log(file):
+    with open(file, 'rb') as fh:
+        data = fh.read()
+    games = []
+    offset = 0
+    while offset < len(data):
+        game, offset = decode_game(data, offset)
+        games.append(game)
+    return games
+
+# Decodes the game starting at |offset| of |data|, returns it with the offset of the next game.
+def decode_game(data, offset):
+    game, offset = decode_header(data, offset)
+    actions = []
+    for _ in range(game.pop('num_actions')):
+        code, x, y = RECORD.unpack_from(data, offset)
+        actions.append((ACTIONS[code], x, y))
+        offset += RECORD.size
+    game['actions'] = actions
+    return game, offset
+
+# Decodes the header of the game starting at |offset| of |data|: returns the game with
+# 'num_actions' instead of 'actions', and the offset of its first action.
+def decode_header(data, offset):
+    magic, version, length, width, num_mines, seed, final_score, timestamp, num_actions, agent_length, grid_length = \
+        HEADER.unpack_from(data, offset)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a game log (version {}) at offset {}".format(VERSION, offset))
+    offset += HEADER.size
+    agent = data[offset:offset + agent_length].decode("ascii")
+    offset += agent_length
+    grid = data[offset:offset + grid_length].decode("ascii")
+    offset += grid_length
+    config = {'seed': seed, 'length': length, 'width': width, 'num_mines': num_mines}
+    if grid:
+        config['grid'] = grid
+    return {
+        'agent': agent,
+        'timestamp': timestamp,
+        'config': config,
+        'final_score': final_score,
+        'num_actions': num_actions
+    }, offset
+
+# Returns a list of (position, game) for the games of a binary log, with 'num_actions' in
+# place of 'actions'. The actions are skipped, not read.
+def read_binary_headers(file):
+    games = []
+    with open(file, 'rb') as fh:
+        while True:
+            position = fh.tell()
+            data = fh.read(HEADER.size + 2 * 255)
+            if not data:
+                return games
+            game, offset = decode_header(data, 0)
+            games.append((position, game))
+            fh.seek(position + offset + game['num_actions'] * RECORD.size)
+
+# Returns the games of a log file of either format, as read_binary_log does.
+# For YAML logs, the agent and the time come from the file name.
+def read_log(file):
+    if file.endswith(BINARY_EXTENSION):
+        return read_binary_log(file)
+    with open(file) as fh:
+        game = yaml.load(fh, Loader=yaml.Loader)
+    game['agent'], game['timestamp'] = parse_log_name(file)
+    return [game]
+
+# Returns (agent, unix time) from a log file name "agent-date_seed_score.yml"; the time is
+# the modification time of the file if the name has no date.
+def parse_log_name(file):
+    agent, _, rest = os.path.basename(file).partition('-')
+    try:
+        date = dt.datetime.strptime("_".join(rest.split('_')[:2]), DATE_FORMAT)
+        return agent, int(time.mktime(date.timetuple()))
+    except ValueError:
+        return agent, int(os.path.getmtime(file))
+
+# Writes the binary version of a YAML log next to it (or to |out_file|), returns its path.
+def convert_yaml_log(yml_file, out_file=None):
+    if not out_file:
+        out_file = os.path.splitext(yml_file)[0] + BINARY_EXTENSION
+    game = read_log(yml_file)[0]
+    actions = [tuple(a) for a in game['actions']]
+    with open(out_file, 'wb') as fh:
+        fh.write(encode_game(game['agent'], game['config'], game['final_score'], actions, game['timestamp']))
+    return out_file
+
+# Adds the games of the logs of log_dir to its Catalog - all of them if rebuild, else those of
+# the files not in the catalog yet. A .yml log is skipped when its binary copy exists, and its
+# games leave the catalog when the binary copy is added (e.g. after game.py convert), so that
+# every game is counted once.
+# Returns the number of games added, not counting those replacing their .yml copy.
+def ingest_logs(log_dir, rebuild=False):
+    catalog = Catalog(log_dir)
+    if rebuild:
+        catalog.clear()
+    known_files = catalog.files()
+    names = set(os.listdir(log_dir))
+    games = []
+    replaced = []
+    num_replaced_games = 0
+    for name in sorted(names - known_files):
+        file = os.path.join(log_dir, name)
+        stem, extension = os.path.splitext(name)
+        if extension == BINARY_EXTENSION:
+            games.extend((file, position, game) for position, game in read_binary_headers(file))
+            if stem + ".yml" in known_files:
+                replaced.append(stem + ".yml")
+                num_replaced_games += catalog.count(stem + ".yml")
+        elif extension == ".yml" and stem + BINARY_EXTENSION not in names:
+            game = read_log(file)[0]
+            game['num_actions'] = len(game.pop('actions'))
+            games.append((file, 0, game))
+    catalog.add(games, replaced)
+    return len(games) - num_replaced_games
@@ -14,11 +14,8 @@ class NNPlayerMDP(MiningMDP):
     def updateBoardState(self, player=None):
         if not player:
             player = self.player
-        state = np.array([[-2.0 for j in range(self.width)] for i in range(self.length)])
-        for y in range(self.length):
-            for x in range(self.width):
-                if player.currentPlayerBoard[x][y] != 'x':
-                    state[x][y] = player.currentPlayerBoard[x][y]
+        # The player board already uses -2 (PlayerBoard.UNKNOWN) for unexplored tiles.
+        state = player.currentPlayerBoard.astype(np.float64)
         return state.flatten()[:, np.newaxis]
 
 class NNPlayer(AIPlayer):
@@ -77,7 +74,7 @@ class NNPlayer(AIPlayer):
 
     def run(self, episodes=1000, save_log=True):
         explorationProb = 0.5
-        mdp = NNPlayerMDP(self.length, self.width, self.num_mines)
+        mdp = NNPlayerMDP(self.length, self.width, self.num_mines, self.rng)
         discount = mdp.discount()
         self.input_dimension = self.length * self.width
         self.output_dimension = self.input_dimension * 2
@@ -103,8 +100,8 @@ class NNPlayer(AIPlayer):
                         X: boardState
                     })
                     _, nextAction, index = self.getActionFromNNOutput(mdp, state, allQ)
-                    if random.random() < explorationProb:
-                        nextAction = random.choice(mdp.actions(state))
+                    if self.rng.random() < explorationProb:
+                        nextAction = self.rng.choice(mdp.actions(state))
                         index = self.actionToQIndex(nextAction)
                     # run the action through mdp to get new state and reward
                     newState, reward = mdp.succAndProbReward(state, nextAction)
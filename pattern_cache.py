@@ -0,0 +1,98 @@
+import collections
+import json
+import os
+import sqlite3
+
+# The 8 symmetries of the square, as (swap x and y, sign of x, sign of y).
+SYMMETRIES = [(swap, sx, sy) for swap in (False, True) for sx in (1, -1) for sy in (1, -1)]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS patterns (
+    pattern TEXT PRIMARY KEY,
+    tallies TEXT NOT NULL
+);
+"""
+
+# Returns the canonical form of a frontier component, a tuple of (cells, k) constraints (see
+# csp.frontier_constraints): the same for every rotation, reflection and translation of it.
+# Returns (pattern, mapping), where the pattern is the smallest of the constraints moved by each
+# symmetry and translated to (0, 0), and mapping takes the cells of the component to the cells
+# of the pattern.
+def canonical_form(constraints):
+    cells = sorted(set(cell for cs, _ in constraints for cell in cs))
+    best = None
+    for swap, sx, sy in SYMMETRIES:
+        moved = [(sx * y, sy * x) if swap else (sx * x, sy * y) for x, y in cells]
+        min_x = min(x for x, _ in moved)
+        min_y = min(y for _, y in moved)
+        mapping = {cell: (x - min_x, y - min_y) for cell, (x, y) in zip(cells, moved)}
+        pattern = tuple(sorted((tuple(sorted(mapping[cell] for cell in cs)), k) for cs, k in constraints))
+        if best is None or pattern < best[0]:
+            best = (pattern, mapping)
+    return best
+
+# Renames the cells of tallies (as returned by csp.solve_component) with mapping.
+def map_tallies(tallies, mapping):
+    return {m: (n, {mapping[cell]: count for cell, count in num_mines.items()})
+            for m, (n, num_mines) in tallies.items()}
+
+# Solutions of frontier components (csp.solve_component tallies) by canonical pattern, so that a
+# component is solved once for all its rotations, reflections and positions, across games. Keeps
+# the capacity most recently used patterns in memory; with a path, patterns are also stored in
+# an SQLite file there, shared by every run using it.
+class PatternCache:
+    def __init__(self, capacity=10000, path=None):
+        self.capacity = capacity
+        self.patterns = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Canonical form of the last component looked up, for the put() that follows a miss.
+        self.last = (None, None)
+        self.connection = None
+        if path is not None:
+            directory = os.path.dirname(path)
+            if directory and not os.path.exists(directory):
+                os.makedirs(directory)
+            self.connection = sqlite3.connect(path)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.executescript(SCHEMA)
+
+    def canonical_form(self, constraints):
+        if self.last[0] != constraints:
+            self.last = (constraints, canonical_form(constraints))
+        return self.last[1]
+
+    # Returns the tallies of the component (in its own cells), or None if it isn't cached.
+    def get(self, constraints):
+        pattern, mapping = self.canonical_form(constraints)
+        tallies = self.patterns.pop(pattern, None)
+        if tallies is None and self.connection is not None:
+            row = self.connection.execute("SELECT tallies FROM patterns WHERE pattern = ?", (repr(pattern),)).fetchone()
+            if row is not None:
+                tallies = {m: (n, {tuple(cell): count for cell, count in num_mines})
+                           for m, n, num_mines in json.loads(row[0])}
+                self.remember(pattern, tallies)
+        if tallies is None:
+            self.misses += 1
+            return None
+        self.patterns[pattern] = tallies
+        self.hits += 1
+        inverse = {cell: original for original, cell in mapping.items()}
+        return map_tallies(tallies, inverse)
+
+    def put(self, constraints, tallies):
+        pattern, mapping = self.canonical_form(constraints)
+        tallies = map_tallies(tallies, mapping)
+        self.remember(pattern, tallies)
+        if self.connection is not None:
+            data = json.dumps([[m, n, sorted(num_mines.items())] for m, (n, num_mines) in sorted(tallies.items())])
+            with self.connection:
+                self.connection.execute("INSERT OR REPLACE INTO patterns VALUES (?, ?)", (repr(pattern), data))
+
+    # Adds a pattern to memory, evicting the least recently used one when full.
+    def remember(self, pattern, tallies):
+        self.patterns.pop(pattern, None)
+        self.patterns[pattern] = tallies
+        while len(self.patterns) > self.capacity:
+            self.patterns.popitem(last=False)
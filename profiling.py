@@ -0,0 +1,31 @@
+import collections
+import json
+import time
+
+# Records metrics of the CSP solver (one record per solve, and per move of the csp agent) in a
+# ring buffer of the capacity last records, and as JSON lines in the file at path if given, to
+# find the board states that blow up the solver. Set it as BacktrackingSearch.profiler (which
+# CspAIPlayer also passes to its other backends) and CspAIPlayer.profiler, e.g. with
+# game.py csp --profile=FILE.
+class Profiler:
+    def __init__(self, capacity=10000, path=None):
+        self.records = collections.deque(maxlen=capacity)
+        # Line buffered, so that the file is complete even if the run is interrupted.
+        self.sink = open(path, 'a', 1) if path is not None else None
+
+    # Adds a record of the given event ("solve", "move") and metrics, with the current time.
+    def record(self, event, **metrics):
+        metrics['event'] = event
+        metrics['time'] = time.time()
+        self.records.append(metrics)
+        if self.sink is not None:
+            self.sink.write(json.dumps(metrics, sort_keys=True) + "\n")
+
+    # Returns the records of the given event, slowest first.
+    def slowest(self, event="solve"):
+        return sorted((r for r in self.records if r['event'] == event), key=lambda r: r['seconds'], reverse=True)
+
+    def close(self):
+        if self.sink is not None:
+            self.sink.close()
+            self.sink = None
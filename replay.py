@@ -0,0 +1,76 @@
+"""Headless replay of game logs, to check that they reproduce their final score."""
+import os
+import sys
+import multiprocessing
+from Grid import Grid, GRID_CLASSES
+from Player import Player
+from logger import read_log, BINARY_EXTENSION
+
+# Returns the Player after replaying all the actions of |game| (as returned by
+# logger.read_log) on the board rebuilt from its seed. Hints reveal the logged mine.
+def replay_game(game):
+    config = game['config']
+    length, width = int(config['length']), int(config['width'])
+    player = Player(length, width, int(config['num_mines']), int(config['seed']), GRID_CLASSES[config.get('grid', Grid.name)])
+    if game['agent'] == 'csp':
+        # CspAIPlayer.run lifts the limit on the number of flags.
+        player.num_flags_remaining = length * width
+    for action, x, y in game['actions']:
+        if action == 'click':
+            player.click(x, y)
+        elif action == 'flag':
+            player.flag(x, y)
+        elif action == 'hint':
+            player.hint((x, y))
+    return player
+
+# Returns a list of (file, index of the game in the file, logged score, replayed score, error)
+# for the games of |file| whose replay doesn't match the log.
+def verify_log(file):
+    mismatches = []
+    try:
+        games = read_log(file)
+    except Exception as e:
+        return [(file, None, None, None, "unreadable: %s" % e)]
+    for i, game in enumerate(games):
+        try:
+            score = replay_game(game).score
+        except Exception as e:
+            mismatches.append((file, i, game['final_score'], None, str(e)))
+            continue
+        if score != game['final_score']:
+            mismatches.append((file, i, game['final_score'], score, "score mismatch"))
+    return mismatches
+
+# Verifies the given log files, and the logs in the given directories, on |processes| processes
+# (default: one per core). Returns (number of files, list of mismatches as in verify_log).
+def verify_logs(paths, processes=None):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith((".yml", BINARY_EXTENSION)))
+        else:
+            files.append(path)
+    pool = multiprocessing.Pool(processes)
+    try:
+        mismatches = [m for result in pool.imap_unordered(verify_log, files, chunksize=16) for m in result]
+    finally:
+        pool.close()
+        pool.join()
+    return len(files), sorted(mismatches)
+
+def main():
+    if len(sys.argv) < 2:
+        print("""
+        Sample usage:
+        python replay.py logs/ [more logs or directories]
+        replays every game at full speed and reports those whose score doesn't match the log.
+        """)
+        return
+    num_files, mismatches = verify_logs(sys.argv[1:])
+    for file, index, logged, replayed, error in mismatches:
+        print("{} (game {}): logged score {}, replayed score {} - {}".format(file, index, logged, replayed, error))
+    print("Verified {} files, {} mismatches".format(num_files, len(mismatches)))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,313 @@
+import heapq
+import time
+
+# A CDCL (conflict-driven clause learning) SAT solver, and an alternate backend for the
+# frontier components of CspAIPlayer that encodes them as clauses.
+#
+# Variables are numbered from 1; a literal is 2 * var for var true and 2 * var + 1 for var
+# false, so that lit ^ 1 is its negation.
+
+def positive(var):
+    return 2 * var
+
+def negative(var):
+    return 2 * var + 1
+
+# The Luby sequence 1 1 2 1 1 2 4 1 1 2 ..., which scales the intervals between restarts.
+def luby(i):
+    size, power = 1, 1
+    while size < i + 1:
+        size, power = 2 * size + 1, 2 * power
+    while size - 1 != i:
+        size = (size - 1) // 2
+        power //= 2
+        i %= size
+    return power
+
+# Solver with two watched literals per clause, first-UIP clause learning, activity-based
+# decisions with saved phases, and restarts on the Luby sequence. Clauses can be added between
+# calls of solve(), which keeps what it learned.
+class SatSolver:
+    restart_interval = 100
+    activity_decay = 0.95
+
+    def __init__(self):
+        self.numVars = 0
+        # Value of every variable: 1 true, -1 false, 0 unassigned.
+        self.values = [0]
+        self.levels = [0]
+        # The clause that implied each variable, None for decisions.
+        self.reasons = [None]
+        self.activity = [0.0]
+        self.phases = [False]
+        self.heap = []
+        self.bump = 1.0
+        # Clauses watching each literal, i.e. clauses whose first or second literal it is.
+        self.watches = [[], []]
+        self.trail = []
+        # Position in the trail of the first assignment of every decision level.
+        self.levelStarts = []
+        self.propagated = 0
+        self.unsatisfiable = False
+        self.numConflicts = 0
+        self.numDecisions = 0
+
+    def new_var(self):
+        self.numVars += 1
+        self.values.append(0)
+        self.levels.append(0)
+        self.reasons.append(None)
+        self.activity.append(0.0)
+        self.phases.append(False)
+        self.watches += [[], []]
+        heapq.heappush(self.heap, (0.0, self.numVars))
+        return self.numVars
+
+    def value(self, lit):
+        v = self.values[lit >> 1]
+        return -v if lit & 1 else v
+
+    def assign(self, lit, reason):
+        var = lit >> 1
+        self.values[var] = -1 if lit & 1 else 1
+        self.levels[var] = len(self.levelStarts)
+        self.reasons[var] = reason
+        self.trail.append(lit)
+
+    # Adds a clause (a list of literals), at decision level 0. Returns False once the clauses
+    # can't be satisfied.
+    def add_clause(self, lits):
+        self.backtrack(0)
+        if self.unsatisfiable:
+            return False
+        clause = []
+        lits = set(lits)
+        for lit in lits:
+            if self.value(lit) == 1 or lit ^ 1 in lits:
+                return True
+            if self.value(lit) == 0:
+                clause.append(lit)
+        if not clause:
+            self.unsatisfiable = True
+        elif len(clause) == 1:
+            self.assign(clause[0], None)
+            self.unsatisfiable = self.propagate() is not None
+        else:
+            self.watches[clause[0]].append(clause)
+            self.watches[clause[1]].append(clause)
+        return not self.unsatisfiable
+
+    # Assigns the literals implied by the clauses. Returns a clause with all its literals false,
+    # or None.
+    def propagate(self):
+        while self.propagated < len(self.trail):
+            false = self.trail[self.propagated] ^ 1
+            self.propagated += 1
+            watching = self.watches[false]
+            kept = []
+            i = 0
+            while i < len(watching):
+                clause = watching[i]
+                i += 1
+                if clause[0] == false:
+                    clause[0], clause[1] = clause[1], false
+                if self.value(clause[0]) == 1:
+                    kept.append(clause)
+                    continue
+                for k in xrange(2, len(clause)):
+                    if self.value(clause[k]) != -1:
+                        clause[1], clause[k] = clause[k], false
+                        self.watches[clause[1]].append(clause)
+                        break
+                else:
+                    kept.append(clause)
+                    if self.value(clause[0]) == -1:
+                        kept.extend(watching[i:])
+                        self.watches[false] = kept
+                        return clause
+                    self.assign(clause[0], clause)
+            self.watches[false] = kept
+        return None
+
+    # First-UIP conflict analysis. Returns the learned clause, its asserting literal first and
+    # a literal of the level to go back to second, and that level.
+    def analyze(self, conflict):
+        seen = set()
+        learned = [None]
+        level = len(self.levelStarts)
+        pending = 0
+        lit = None
+        index = len(self.trail)
+        clause = conflict
+        while True:
+            for q in (clause if lit is None else clause[1:]):
+                var = q >> 1
+                if var in seen or self.levels[var] == 0:
+                    continue
+                seen.add(var)
+                self.bump_activity(var)
+                if self.levels[var] == level:
+                    pending += 1
+                else:
+                    learned.append(q)
+            # The next literal of the current level on the trail that is in the conflict.
+            index -= 1
+            while self.trail[index] >> 1 not in seen:
+                index -= 1
+            lit = self.trail[index]
+            pending -= 1
+            if pending == 0:
+                break
+            clause = self.reasons[lit >> 1]
+            # The implied literal comes first in its reason clause.
+            if clause[0] != lit:
+                position = clause.index(lit)
+                clause[0], clause[position] = clause[position], clause[0]
+        learned[0] = lit ^ 1
+        if len(learned) == 1:
+            return learned, 0
+        highest = max(range(1, len(learned)), key=lambda i: self.levels[learned[i] >> 1])
+        learned[1], learned[highest] = learned[highest], learned[1]
+        return learned, self.levels[learned[1] >> 1]
+
+    def bump_activity(self, var):
+        self.activity[var] += self.bump
+        if self.activity[var] > 1e100:
+            self.activity = [a * 1e-100 for a in self.activity]
+            self.bump *= 1e-100
+            self.heap = [(-self.activity[v], v) for v in range(1, self.numVars + 1) if not self.values[v]]
+            heapq.heapify(self.heap)
+        elif not self.values[var]:
+            heapq.heappush(self.heap, (-self.activity[var], var))
+
+    # Undoes the assignments above decision |level|, saving their phases.
+    def backtrack(self, level):
+        if len(self.levelStarts) <= level:
+            return
+        start = self.levelStarts[level]
+        for lit in self.trail[start:]:
+            var = lit >> 1
+            self.phases[var] = not lit & 1
+            self.values[var] = 0
+            self.reasons[var] = None
+            heapq.heappush(self.heap, (-self.activity[var], var))
+        del self.trail[start:]
+        del self.levelStarts[level:]
+        self.propagated = start
+
+    # The unassigned variable of highest activity, or None when all are assigned.
+    def pick_branch_var(self):
+        while self.heap:
+            activity, var = heapq.heappop(self.heap)
+            if not self.values[var] and -activity == self.activity[var]:
+                return var
+        return None
+
+    # Searches for an assignment satisfying every clause, within the given budget of seconds and
+    # of conflicts plus decisions. Returns True (then model() has it), False if there is none,
+    # or None when the budget ran out.
+    def solve(self, deadline=None, maxNodes=None):
+        if self.unsatisfiable:
+            return False
+        restarts = 0
+        conflicts_left = self.restart_interval * luby(restarts)
+        while True:
+            conflict = self.propagate()
+            if conflict is not None:
+                self.numConflicts += 1
+                conflicts_left -= 1
+                if not self.levelStarts:
+                    self.unsatisfiable = True
+                    return False
+                learned, level = self.analyze(conflict)
+                self.backtrack(level)
+                if len(learned) == 1:
+                    self.assign(learned[0], None)
+                else:
+                    self.watches[learned[0]].append(learned)
+                    self.watches[learned[1]].append(learned)
+                    self.assign(learned[0], learned)
+                self.bump /= self.activity_decay
+                continue
+            if maxNodes is not None and self.numConflicts + self.numDecisions > maxNodes:
+                return None
+            if deadline is not None and time.time() > deadline:
+                return None
+            if conflicts_left <= 0:
+                restarts += 1
+                conflicts_left = self.restart_interval * luby(restarts)
+                self.backtrack(0)
+                continue
+            var = self.pick_branch_var()
+            if var is None:
+                return True
+            self.numDecisions += 1
+            self.levelStarts.append(len(self.trail))
+            self.assign(positive(var) if self.phases[var] else negative(var), None)
+
+    def model(self):
+        return [self.values[var] == 1 for var in range(self.numVars + 1)]
+
+# Adds clauses saying that at most k of the literals are true (sequential counter encoding:
+# register (i, j) is true when at least j of the first i + 1 literals are).
+def add_at_most(solver, lits, k):
+    n = len(lits)
+    if k >= n:
+        return
+    if k == 0:
+        for lit in lits:
+            solver.add_clause([lit ^ 1])
+        return
+    registers = [[solver.new_var() for _ in range(k)] for _ in range(n - 1)]
+    solver.add_clause([lits[0] ^ 1, positive(registers[0][0])])
+    for j in range(1, k):
+        solver.add_clause([negative(registers[0][j])])
+    for i in range(1, n - 1):
+        solver.add_clause([lits[i] ^ 1, positive(registers[i][0])])
+        solver.add_clause([negative(registers[i - 1][0]), positive(registers[i][0])])
+        for j in range(1, k):
+            solver.add_clause([lits[i] ^ 1, negative(registers[i - 1][j - 1]), positive(registers[i][j])])
+            solver.add_clause([negative(registers[i - 1][j]), positive(registers[i][j])])
+        solver.add_clause([lits[i] ^ 1, negative(registers[i - 1][k - 1])])
+    solver.add_clause([lits[n - 1] ^ 1, negative(registers[n - 2][k - 1])])
+
+# Adds clauses saying that exactly k of the literals are true.
+def add_exactly(solver, lits, k):
+    add_at_most(solver, lits, k)
+    add_at_most(solver, [lit ^ 1 for lit in lits], len(lits) - k)
+
+# Same as csp.solve_component, with the SAT solver: the solutions are enumerated one at a time,
+# each one blocked by a clause before looking for the next, so that what the solver learns is
+# kept for the whole component. The number of nodes is the number of conflicts and decisions.
+# The search is sequential, processes is ignored. The metrics of the solve go to profiler, if any.
+def solve_component(constraints, maxSeconds=None, maxNodes=None, processes=None, profiler=None):
+    start = time.time()
+    deadline = start + maxSeconds if maxSeconds is not None else None
+    solver = SatSolver()
+    cells = sorted(set(cell for cs, _ in constraints for cell in cs))
+    variables = {cell: solver.new_var() for cell in cells}
+    for cs, k in constraints:
+        add_exactly(solver, [positive(variables[cell]) for cell in cs], k)
+    tallies = {}
+    complete = True
+    while True:
+        result = solver.solve(deadline, maxNodes)
+        if result is None:
+            complete = False
+            break
+        if not result:
+            break
+        model = solver.model()
+        mines = [cell for cell in cells if model[variables[cell]]]
+        n, num_mines = tallies.setdefault(len(mines), (0, {cell: 0 for cell in cells}))
+        tallies[len(mines)] = (n + 1, num_mines)
+        for cell in mines:
+            num_mines[cell] += 1
+        solver.add_clause([negative(variables[cell]) if model[variables[cell]] else positive(variables[cell])
+                           for cell in cells])
+    if profiler is not None:
+        profiler.record("solve", solver="sat", variables=len(cells), constraints=len(constraints),
+                        nodes=solver.numConflicts + solver.numDecisions, conflicts=solver.numConflicts,
+                        decisions=solver.numDecisions, solutions=sum(n for n, _ in tallies.values()),
+                        complete=complete, seconds=time.time() - start)
+    return tallies, complete, solver.numConflicts + solver.numDecisions
@@ -1,15 +1,15 @@
 from __future__ import print_function
 import os
-import yaml
 import Tkinter as tk
 import threading
 import tkMessageBox
 import random
 import sys
-from Grid import Grid
+from Grid import Grid, GRID_CLASSES
 from Player import Player
 from RLPlayer import RLPlayer
 from Player import BaselineAIPlayer
+from logger import read_log
 
 class Tile:
     images = {}
@@ -160,6 +160,7 @@ def main():
         help_msg = """
         Sample usage:
         python simulator.py AGENT LENGTH WIDTH MINES
+        python simulator.py simulate LOG_FILE (.yml or .mlog, the first game of the file)
         Choice of AGENT: {human, simulate}
         For example:
         python simulator.py human 3 4 5
@@ -174,30 +175,29 @@ def main():
         gui = Gui(root, player)
         gui.run()
     elif sys.argv[1] == 'simulate':
-        yml_file = sys.argv[2]
-        if not os.path.exists(yml_file):
-            prin( "File {} does not exist".format(yml_file))
-        basename = os.path.basename(yml_file)
-        agent = basename.split('-')[0]
-        with open(yml_file) as fh:
-            yml_content = yaml.load(fh)
-        game_config = yml_content['config']
-        actions = yml_content['actions']
+        log_file = sys.argv[2]
+        if not os.path.exists(log_file):
+            prin( "File {} does not exist".format(log_file))
+        game = read_log(log_file)[0]
+        agent = game['agent']
+        game_config = game['config']
+        actions = game['actions']
+        grid_class = GRID_CLASSES[game_config.get('grid', Grid.name)]
         print("Agent: {}, length: {}, width: {}, num_mines: {}, seed: {}".format(agent, game_config['length'], game_config['width'], game_config['num_mines'], game_config['seed']))
         if agent == 'baseline':
-            player = BaselineAIPlayer(int(game_config['length']), int(game_config['width']), int(game_config['num_mines']), int(game_config['seed']))
+            player = BaselineAIPlayer(int(game_config['length']), int(game_config['width']), int(game_config['num_mines']), int(game_config['seed']), grid_class)
             score = player.run(save_log=False)
             print("Final score is: " +  str(score))
         elif agent == 'qlearning':
-            player = RLPlayer(int(game_config['length']), int(game_config['width']), int(game_config['num_mines']), int(game_config['seed']))
+            player = RLPlayer(int(game_config['length']), int(game_config['width']), int(game_config['num_mines']), int(game_config['seed']), grid_class)
         else:
-            player = Player(int(game_config['length']), int(game_config['width']), int(game_config['num_mines']), int(game_config['seed']))
+            player = Player(int(game_config['length']), int(game_config['width']), int(game_config['num_mines']), int(game_config['seed']), grid_class)
 
 
         root = tk.Tk()
         Tile.import_images()
         gui = Gui(root, player)
-        sim = Simulator(gui, yml_content['actions'])
+        sim = Simulator(gui, actions)
         sim.start()
         gui.run()
 
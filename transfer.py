@@ -0,0 +1,162 @@
+import time
+
+# Transfer-matrix dynamic programming over a frontier component, for boards long in one
+# direction: the cells are swept one column at a time along the longer side of the component,
+# and a table over the states (mines among the cells) of the last two columns is carried along,
+# with the number of solutions as a polynomial in the number of mines. The time is linear in the
+# length of the component and exponential only in its width.
+
+# Boards with at most that many rows or columns are solved with this engine by CspAIPlayer, and
+# no component with a wider column is (its tables would have 4^width entries).
+TRANSFER_MAX_WIDTH = 8
+
+def popcount(mask):
+    return bin(mask).count('1')
+
+# Adds the polynomial poly (list of coefficients, by number of mines) times z^shift to acc.
+def add_shifted(acc, poly, shift):
+    if len(acc) < len(poly) + shift:
+        acc.extend([0] * (len(poly) + shift - len(acc)))
+    for m, n in enumerate(poly):
+        if n:
+            acc[m + shift] += n
+
+def multiply(a, b):
+    result = [0] * (len(a) + len(b) - 1)
+    for i, x in enumerate(a):
+        if x:
+            for j, y in enumerate(b):
+                if y:
+                    result[i + j] += x * y
+    return result
+
+# Splits the cells into columns along the longer side of the component. Returns the axis (0 for
+# the first coordinate), the coordinate of the first column, and the cells of every column.
+def sweep_columns(cells):
+    xs, ys = [x for x, _ in cells], [y for _, y in cells]
+    axis = 0 if max(xs) - min(xs) >= max(ys) - min(ys) else 1
+    first = min(cell[axis] for cell in cells)
+    columns = [[] for _ in range(max(cell[axis] for cell in cells) - first + 1)]
+    for cell in cells:
+        columns[cell[axis] - first].append(cell)
+    return axis, first, columns
+
+# Whether the columns of the component (a tuple of constraints) are narrow enough for the engine.
+def fits(constraints):
+    cells = set(cell for cs, _ in constraints for cell in cs)
+    return max(len(column) for column in sweep_columns(cells)[2]) <= TRANSFER_MAX_WIDTH
+
+# Same as csp.solve_component: counts the solutions of the constraints by number of mines, with
+# the number of them where each cell is a mine. The budget counts as nodes the table entries
+# tried by the forward and the backward sweeps, and those summed into the tallies.
+# Constraints come from the numbers of the board, so each one spans at most 3 columns, and no
+# column may have more than TRANSFER_MAX_WIDTH cells (see fits). The metrics of the solve go to
+# profiler, if any.
+def solve_component(constraints, maxSeconds=None, maxNodes=None, processes=None, profiler=None):
+    start = time.time()
+    deadline = start + maxSeconds if maxSeconds is not None else None
+    cells = sorted(set(cell for cs, _ in constraints for cell in cs))
+    # Sweep along the longer side of the component: column c holds cells[axis] == first + c.
+    axis, first, columns = sweep_columns(cells)
+    num_columns = len(columns)
+    width = max(len(column) for column in columns)
+    if width > TRANSFER_MAX_WIDTH:
+        raise ValueError("A column has %d cells, more than %d" % (width, TRANSFER_MAX_WIDTH))
+    bit = {}
+    for column in columns:
+        for i, cell in enumerate(column):
+            bit[cell] = 1 << i
+    # Constraints checked once the states of column c and the two before are known: those whose
+    # last column is c, as (mask in column c - 2, mask in column c - 1, mask in column c, k).
+    checks = [[] for _ in range(num_columns)]
+    for cs, k in constraints:
+        last = max(cell[axis] for cell in cs) - first
+        if last - (min(cell[axis] for cell in cs) - first) > 2:
+            raise ValueError("A constraint spans more than 3 columns: %s" % (cs,))
+        masks = [0, 0, 0]
+        for cell in cs:
+            masks[cell[axis] - first - last + 2] |= bit[cell]
+        checks[last].append((masks[0], masks[1], masks[2], k))
+    states = [xrange(1 << len(column)) for column in columns]
+
+    def valid(c, s2, s1, s0):
+        for m2, m1, m0, k in checks[c]:
+            if popcount(s2 & m2) + popcount(s1 & m1) + popcount(s0 & m0) != k:
+                return False
+        return True
+
+    nodes = [0]
+    def out_of_budget():
+        nodes[0] += 1
+        if maxNodes is not None and nodes[0] > maxNodes:
+            return True
+        return deadline is not None and nodes[0] % 256 == 0 and time.time() > deadline
+
+    def finish(result, complete):
+        if profiler is not None:
+            profiler.record("solve", solver="transfer", variables=len(cells), constraints=len(constraints),
+                            columns=num_columns, width=width, nodes=nodes[0],
+                            solutions=sum(n for n, _ in result.values()), complete=complete,
+                            seconds=time.time() - start)
+        return result, complete, nodes[0]
+
+    # forward[c][(s1, s0)]: solutions of the columns up to c (states s1 of c - 1 and s0 of c)
+    # meeting the constraints checked up to c, as a polynomial in the number of mines.
+    forward = []
+    previous = {(0, 0): [1]}
+    for c in range(num_columns):
+        table = {}
+        for (s2, s1), poly in previous.items():
+            for s0 in states[c]:
+                if out_of_budget():
+                    return finish({}, False)
+                if valid(c, s2, s1, s0):
+                    add_shifted(table.setdefault((s1, s0), []), poly, popcount(s0))
+        forward.append(table)
+        previous = table
+    # backward[c][(s1, s0)]: solutions of the columns after c meeting the constraints checked
+    # after c, given the states of columns c - 1 and c.
+    backward = [None] * num_columns
+    backward[-1] = {key: [1] for key in forward[-1]}
+    for c in range(num_columns - 2, -1, -1):
+        table = {}
+        for (s1, s0) in forward[c]:
+            acc = []
+            for s in states[c + 1]:
+                if out_of_budget():
+                    return finish({}, False)
+                poly = backward[c + 1].get((s0, s))
+                if poly is not None and valid(c + 1, s1, s0, s):
+                    add_shifted(acc, poly, popcount(s))
+            if acc:
+                table[(s1, s0)] = acc
+        backward[c] = table
+
+    tallies = {}
+    totals = []
+    for c in range(num_columns):
+        for key, poly in forward[c].items():
+            if out_of_budget():
+                return finish({}, False)
+            if key not in backward[c]:
+                continue
+            product = multiply(poly, backward[c][key])
+            if c == 0:
+                add_shifted(totals, product, 0)
+            for cell in columns[c]:
+                if key[1] & bit[cell]:
+                    for m, n in enumerate(product):
+                        if n:
+                            tallies.setdefault(m, {}).setdefault(cell, 0)
+                            tallies[m][cell] += n
+    result = {}
+    for m, n in enumerate(totals):
+        if n:
+            num_mines = {cell: 0 for cell in cells}
+            num_mines.update(tallies.get(m, {}))
+            result[m] = (n, num_mines)
+    return finish(result, True)
+
+# Whether CspAIPlayer should use this engine on a board of that size.
+def suits(length, width):
+    return min(length, width) <= TRANSFER_MAX_WIDTH and max(length, width) >= 4 * min(length, width)
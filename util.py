@@ -1,4 +1,5 @@
 import json, re
+import numpy as np
 
 # General code for representing a weighted CSP (Constraint Satisfaction Problem).
 # All variables are being referenced by their index instead of their original
@@ -41,6 +42,14 @@ class CSP:
 
         self.binaryFactors = {}
 
+        # List of n-ary cardinality constraints. Each one is a pair (variables, k)
+        # meaning that the values of |variables|, which must be numbers, sum to
+        # exactly k. E.g. ([A, B, C], 1) with domains [0, 1] says exactly one of
+        # A, B, C is 1. cardinalityConstraintsOf[K] is the list of indexes in
+        # cardinalityConstraints of the constraints involving variable K.
+        self.cardinalityConstraints = []
+        self.cardinalityConstraintsOf = {}
+
     def add_variable(self, var, domain):
         """
         Add a new variable to the CSP.
@@ -53,6 +62,7 @@ class CSP:
         self.values[var] = domain
         self.unaryFactors[var] = None
         self.binaryFactors[var] = dict()
+        self.cardinalityConstraintsOf[var] = []
 
 
     def get_neighbor_vars(self, var):
@@ -108,6 +118,18 @@ class CSP:
             {val2: {val1: float(factor_func(val1, val2)) \
                 for val1 in self.values[var1]} for val2 in self.values[var2]})
 
+    def add_cardinality_constraint(self, variables, k):
+        """
+        Add a constraint that the values of |variables| sum to exactly |k|.
+        Unlike a chain of auxiliary sum variables with binary factors, it adds
+        no variable: the solver checks it against the lower and upper bounds of
+        the sum during the search.
+        """
+        index = len(self.cardinalityConstraints)
+        self.cardinalityConstraints.append((list(variables), k))
+        for var in variables:
+            self.cardinalityConstraintsOf[var].append(index)
+
     def update_binary_factor_table(self, var1, var2, table):
         """
         Private method you can skip for 0c, might be useful for 1c though.
@@ -124,6 +146,58 @@ class CSP:
                     assert i in currentTable and j in currentTable[i]
                     currentTable[i][j] *= table[i][j]
 
+# Array form of a CSP for the solver, built once from a CSP: variables and
+# values are referenced by their index, factors are lists of weights by value
+# index, and the supports of binary factors are bitsets.
+class CompiledCSP:
+    def __init__(self, csp):
+        # Variable names in the order of the CSP, and index of each name.
+        self.variables = list(csp.variables)
+        self.numVars = len(self.variables)
+        self.index = {var: i for i, var in enumerate(self.variables)}
+
+        # values[i] is the domain of variable i; a value is referenced by its
+        # position in it. keys[i][a] is the (name, value) of value a of i.
+        self.values = [list(csp.values[var]) for var in self.variables]
+        self.keys = [[(var, val) for val in csp.values[var]] for var in self.variables]
+
+        # unaryWeights[i] is the factor of variable i as a list of floats by
+        # value index, or None.
+        self.unaryWeights = []
+        for var in self.variables:
+            factor = csp.unaryFactors[var]
+            if factor is None:
+                self.unaryWeights.append(None)
+            else:
+                self.unaryWeights.append([float(factor[val]) for val in csp.values[var]])
+
+        # neighbors[i] lists, for every variable j sharing a factor with i,
+        # (j, weights, supports) where weights[a][b] is the factor for value a of
+        # i and value b of j, and supports[a] is the bitset of the values of j
+        # compatible with value a of i (bit b set when the factor is not 0).
+        # They are in the order of j, not of the dictionary of the CSP, which
+        # changes when the CSP is pickled: the counters of arc consistency depend
+        # on the order and must not change when the search is split (see
+        # BacktrackingSearch.solve_subtrees).
+        self.neighbors = []
+        for var in self.variables:
+            neighbors = []
+            for var2 in sorted(csp.binaryFactors[var], key=self.index.get):
+                table = csp.binaryFactors[var][var2]
+                j = self.index[var2]
+                matrix = np.array([[table[val][val2] for val2 in csp.values[var2]]
+                                   for val in csp.values[var]], dtype=np.float64).reshape(
+                                       len(csp.values[var]), len(csp.values[var2]))
+                supports = [sum(1 << int(b) for b in np.flatnonzero(row)) for row in matrix]
+                neighbors.append((j, matrix.tolist(), supports))
+            self.neighbors.append(neighbors)
+
+        # Cardinality constraints as (variable indexes, k), and the constraints of
+        # each variable, as in the CSP.
+        self.cardinalityConstraints = [([self.index[var] for var in variables], k)
+                                       for variables, k in csp.cardinalityConstraints]
+        self.cardinalityConstraintsOf = [csp.cardinalityConstraintsOf[var] for var in self.variables]
+
 def get_or_variable(csp, name, variables, value):
     """
     Create a new variable with domain [True, False] that can only be assigned to
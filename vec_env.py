@@ -0,0 +1,117 @@
+import numpy as np
+from Grid import BoardBatch
+from Player import CLICK_REWARDS, FLAG_REWARDS, HINT_REWARD
+from PlayerBoard import UNKNOWN
+
+# Action codes of VecMinesweeperEnv.step, and the name of each action for Player.move.
+CLICK, FLAG, HINT = 0, 1, 2
+ACTIONS = ("click", "flag", "hint")
+
+# K games of the same layout played together, with the semantics of MiningMDP and the rewards
+# of Player: click and flag rewards depend on the tile, a hint costs HINT_REWARD, and a known
+# tile, a flag with no flag left or a hint with no mine left is rewarded -inf and changes nothing.
+# The games are stacked arrays, and step() applies one action per game. A game is done when all
+# its tiles are known; it is then replaced by a new game from the same BoardBatch, so the
+# observation returned for it is already the one of the new game.
+#
+# Usage:
+#   env = VecMinesweeperEnv(256, 10, 10, 20)
+#   obs = env.reset()
+#   obs, rewards, dones = env.step(*env.sampleActions())
+class VecMinesweeperEnv:
+    def __init__(self, num_games, length, width, num_mines, seed=None):
+        self.num_games = num_games
+        self.length = length
+        self.width = width
+        self.num_mines = num_mines
+        self.batch = BoardBatch(length, width, num_mines, seed)
+        # Stream of the hints and of sampleActions.
+        self.rng = np.random.RandomState(self.batch.rng.randint(0, 0x0ffffffff))
+        self.games = np.arange(num_games)
+        # Score of the last finished game in each slot, nan until one finishes.
+        self.final_scores = np.full(num_games, np.nan)
+
+    # Starts num_games new games and returns their observations.
+    def reset(self):
+        self.boards, self.seeds = self.batch.generate(self.num_games)
+        self.obs = np.full(self.boards.shape, UNKNOWN, dtype=np.int8)
+        self.score = np.zeros(self.num_games, dtype=np.int64)
+        self.num_moves = np.zeros(self.num_games, dtype=np.int64)
+        self.num_flags_remaining = np.full(self.num_games, self.num_mines, dtype=np.int64)
+        self.num_mines_found = np.zeros(self.num_games, dtype=np.int64)
+        return self.obs.copy()
+
+    # @params: actions, xs, ys: arrays of K action codes and positions. x and y are ignored for hints.
+    # Returns (observations, rewards, dones): the (K, length, width) int8 player boards with
+    # PlayerBoard.UNKNOWN for unknown tiles, the K rewards and the K end-of-game flags.
+    def step(self, actions, xs, ys):
+        actions, xs, ys = np.asarray(actions), np.asarray(xs), np.asarray(ys)
+        # Any position on hint rows, so that whatever they hold is a valid index.
+        xs = np.where(actions == HINT, 0, xs)
+        ys = np.where(actions == HINT, 0, ys)
+        rewards = np.zeros(self.num_games)
+        values = self.boards[self.games, xs, ys]
+        mines = values == -1
+        known = self.obs[self.games, xs, ys] != UNKNOWN
+
+        click = actions == CLICK
+        flag = actions == FLAG
+        no_flag = flag & (self.num_flags_remaining == 0)
+        flag &= ~no_flag
+        # As Player.flag, a flag is used up even on a known tile.
+        self.num_flags_remaining -= flag
+        rewards[no_flag | ((click | flag) & known)] = -float("inf")
+
+        reveal = (click | flag) & ~known
+        rewards[reveal & click] = np.where(mines, CLICK_REWARDS[0], CLICK_REWARDS[1])[reveal & click]
+        rewards[reveal & flag] = np.where(mines, FLAG_REWARDS[0], FLAG_REWARDS[1])[reveal & flag]
+        self.obs[self.games[reveal], xs[reveal], ys[reveal]] = values[reveal]
+        self.num_mines_found += reveal & mines
+        self.num_moves += reveal
+
+        for k in np.flatnonzero(actions == HINT):
+            rewards[k] = self.hint(k)
+
+        self.score += np.where(np.isfinite(rewards), rewards, 0).astype(np.int64)
+        dones = self.num_moves == self.length * self.width
+        if dones.any():
+            self.restart(np.flatnonzero(dones))
+        return self.obs.copy(), rewards, dones
+
+    # Reveals a random unknown mine of game k, returns the reward.
+    def hint(self, k):
+        if self.num_mines_found[k] == self.num_mines:
+            return -float("inf")
+        hidden_mines = np.flatnonzero((self.boards[k] == -1) & (self.obs[k] == UNKNOWN))
+        x, y = divmod(hidden_mines[self.rng.randint(len(hidden_mines))], self.width)
+        self.obs[k, x, y] = -1
+        self.num_mines_found[k] += 1
+        self.num_moves[k] += 1
+        return HINT_REWARD
+
+    # Replaces the finished games |games| with new ones.
+    def restart(self, games):
+        self.final_scores[games] = self.score[games]
+        self.boards[games], seeds = self.batch.generate(len(games))
+        for k, seed in zip(games, seeds):
+            self.seeds[k] = seed
+        self.obs[games] = UNKNOWN
+        self.score[games] = 0
+        self.num_moves[games] = 0
+        self.num_flags_remaining[games] = self.num_mines
+        self.num_mines_found[games] = 0
+
+    # Returns a (K, 2, length, width) boolean array of the legal clicks and flags of every game,
+    # the same actions as MiningMDP.actions.
+    def legalActions(self):
+        unknown = self.obs == UNKNOWN
+        flags = unknown & (self.num_flags_remaining > 0)[:, np.newaxis, np.newaxis]
+        return np.stack([unknown, flags], axis=1)
+
+    # Returns (actions, xs, ys) with one legal action drawn uniformly at random per game.
+    def sampleActions(self):
+        legal = self.legalActions().reshape(self.num_games, -1)
+        choice = np.argmax(np.where(legal, self.rng.random_sample(legal.shape), -1), axis=1)
+        actions, cells = divmod(choice, self.length * self.width)
+        xs, ys = divmod(cells, self.width)
+        return actions, xs, ys